@@ -0,0 +1,147 @@
+"""
+Benchmark of the single-point forcing writer: file size and write throughput
+of the previous writer layout (unlimited time, default chunking, one variable
+defined and written after the other) against the new writer, uncompressed,
+compressed and in float32.
+
+Usage: python benchmarks/bench_forcing_writer.py [--years N] [--out results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import datetime
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "forcings"))
+
+from forcing_writer import forcing_spec, write_forcing_file, grid_vars, edge_vars, global_attrs
+
+
+units: dict[str, str] = {"PRECTmms": "mm/s", "PSRF": "Pa", "FSDS": "W/m^2", "FLDS": "W/m^2",
+                         "RH": "%", "TBOT": "K", "WIND": "m/s"}
+
+# reporting precision of the observations, as decimals per variable
+decimals: dict[str, int] = {"PRECTmms": 8, "PSRF": 0, "FSDS": 1, "FLDS": 1, "RH": 2, "TBOT": 2, "WIND": 2}
+
+settings: dict[str, dict] = {"previous_layout": {"dtype": "float64", "complevel": 0, "previous": True},
+                             "float64_uncompressed": {"dtype": "float64", "complevel": 0},
+                             "float64_zlib4": {"dtype": "float64", "complevel": 4},
+                             "float32_zlib4": {"dtype": "float32", "complevel": 4}}
+
+
+def write_previous_layout(path: str,
+                          spec: list[dict],
+                          values: np.ndarray,
+                          time: np.ndarray,
+                          time_units: str,
+                          lat: float,
+                          lon: float,
+                          latbuffer: float,
+                          lonbuffer: float,
+                          **kwargs) -> None:
+    """
+    Forcing file as written before forcing_writer.py: unlimited time dimension,
+    netCDF4 default chunking, each variable defined and written in turn.
+    """
+    with nc.Dataset(path, "w") as dst:
+
+        dst.createDimension("scalar", 1)
+        dst.createDimension("lon", 1)
+        dst.createDimension("lat", 1)
+        dst.createDimension("time", None)
+
+        dst.setncatts({**global_attrs,
+                       "on_date": datetime.datetime.today().strftime("%Y%m%d%H%M")})
+
+        time_var = dst.createVariable("time", datatype=np.float32, dimensions=("time",))
+        time_var.setncatts({"long_name": "observation time", "units": time_units,
+                            "calendar": "gregorian", "axis": "T"})
+        time_var[:] = time
+
+        grid_values = {"LONGXY": lon, "LATIXY": lat,
+                       "LONE": lon + lonbuffer, "LATN": lat + latbuffer,
+                       "LONW": lon - lonbuffer, "LATS": lat - latbuffer}
+
+        for name, (long_name, units) in grid_vars.items():
+            var = dst.createVariable(name, datatype=np.float32, dimensions=("lat", "lon"),
+                                     fill_value=np.float32(np.nan))
+            var.setncatts({"long_name": long_name, "units": units, "mode": "time-invariant"})
+            var[:, :] = grid_values[name]
+
+        for k, s in enumerate(spec):
+            var = dst.createVariable(s["name"], datatype=np.float64, dimensions=("time", "lat", "lon"),
+                                     fill_value=np.float64(np.nan))
+            var.setncatts({"long_name": s["long_name"], "units": s["units"],
+                           "missing_value": np.float64(np.nan), "mode": "time-dependent"})
+            var[:, :, :] = values[:, k]
+
+        for name, (long_name, units) in edge_vars.items():
+            var = dst.createVariable(name, np.float32, ("scalar",))
+            var.setncatts({"long_name": long_name, "units": units, "mode": "time-invariant"})
+            var[:] = lat if name in ("EDGEN", "EDGES") else lon
+
+
+def synthetic_forcing(years: int,
+                      t_res: str = "30min",
+                      seed: int = 0) -> pd.DataFrame:
+    """Half-hourly forcing with diurnal cycles and noise, rounded like reported observations."""
+    index = pd.date_range("2000-01-01", periods=1, freq=t_res).append(
+            pd.date_range("2000-01-01", f"{2000 + years}-01-01", freq=t_res, inclusive="neither"))
+    rng = np.random.default_rng(seed)
+    hours = index.hour.to_numpy() + index.minute.to_numpy() / 60
+    day = np.sin(np.pi * (hours - 6) / 12).clip(0)
+    n = len(index)
+    return pd.DataFrame({"PRECTmms": rng.exponential(1e-5, n) * (rng.random(n) < 0.1),
+                         "PSRF": 1e5 + rng.normal(0, 300, n),
+                         "FSDS": 800 * day + rng.normal(0, 20, n).clip(0),
+                         "FLDS": 320 + rng.normal(0, 15, n),
+                         "RH": rng.uniform(40, 100, n),
+                         "TBOT": 283 + 8 * day + rng.normal(0, 1, n),
+                         "WIND": rng.gamma(2, 1.5, n)}, index=index).round(decimals)
+
+
+def run(years: int) -> dict:
+    forcing = synthetic_forcing(years)
+    months = list(forcing.groupby([forcing.index.year, forcing.index.month]))
+    results = {"years": years, "n_files": len(months), "n_values": int(forcing.size), "settings": {}}
+
+    for name, opts in settings.items():
+        spec = forcing_spec(units, dtype=opts["dtype"])
+        writer = write_previous_layout if opts.get("previous") else write_forcing_file
+        with tempfile.TemporaryDirectory() as tmp:
+            t0 = time.perf_counter()
+            for (y, m), month in months:
+                t = ((month.index - pd.Timestamp(y, m, 1)) / pd.Timedelta("1h")).to_numpy(dtype=np.float32)
+                writer(os.path.join(tmp, f"{y:04d}-{m:02d}.nc"), spec, month.to_numpy(), t,
+                       f"hours since {y:04d}-{m:02d}-01 00:00:00", 50.0, 6.0, 0.01, 0.01,
+                       complevel=opts["complevel"])
+            seconds = time.perf_counter() - t0
+            size = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp))
+
+        results["settings"][name] = {"seconds": round(seconds, 4),
+                                     "bytes": size,
+                                     "files_per_s": round(len(months) / seconds, 2),
+                                     "values_per_s": round(forcing.size / seconds)}
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--out", default=None, help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(args.years)
+
+    for name, r in results["settings"].items():
+        print(f"{name:22s} {r['bytes'] / 1e6:8.2f} MB  {r['seconds']:7.2f} s  {r['files_per_s']:7.1f} files/s")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
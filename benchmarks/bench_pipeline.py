@@ -0,0 +1,275 @@
+"""
+Runtime and memory benchmark of the extraction and forcing pipelines on
+synthetic eCLM-like fixtures.
+
+Each case runs in a fresh process, so the peak RSS of one case does not
+carry over to the next. Results are written as JSON together with the
+fixture scale and the git commit, and can be compared with an earlier run.
+
+Usage: python benchmarks/bench_pipeline.py [--nlat N] [--nlon N] [--stations N] [--years N]
+                                           [--cases a,b] [--repeat N] [--out results.json]
+                                           [--compare old_results.json]
+"""
+import os
+import sys
+import json
+import time
+import runpy
+import platform
+import argparse
+import importlib
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+import numpy as np
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(bench_dir)
+src_dir = os.path.join(repo_dir, "src")
+extract_dir = os.path.join(repo_dir, "src", "postprocessing", "extract_sites")
+forcings_dir = os.path.join(repo_dir, "src", "forcings")
+
+sys.path[:0] = [bench_dir, src_dir, extract_dir, forcings_dir]
+
+from fixtures import make_fixtures
+
+
+def case_closest_cell(paths: dict[str, str],
+                      scale: dict) -> None:
+    """Station to cell search with grid_to_points and one closest_cell call per station."""
+    import netCDF4 as nc
+    import pandas as pd
+    from extract_sites import grid_to_points, closest_cell
+
+    with nc.Dataset(paths["domain"]) as ds:
+        lat2d, lon2d = ds["yc"][:], ds["xc"][:]
+
+    stations = pd.read_csv(paths["stations"])
+    coords_cells = grid_to_points(lat2d, lon2d)
+    for lat, lon in stations[["geograph.Breite", "geograph.Laenge"]].to_numpy():
+        closest_cell(np.array([lat, lon]), coords_cells, lat2d.shape)
+
+
+def case_cell_index(paths: dict[str, str],
+                    scale: dict) -> None:
+    """Station to cell search with the spatial index used by the extraction."""
+    import netCDF4 as nc
+    import pandas as pd
+    from spatial_index import CellIndex
+
+    with nc.Dataset(paths["domain"]) as ds:
+        lat2d, lon2d = ds["yc"][:], ds["xc"][:]
+
+    stations = pd.read_csv(paths["stations"])
+    CellIndex.from_grid(lat2d, lon2d).query(stations[["geograph.Breite", "geograph.Laenge"]].to_numpy())
+
+
+def run_extraction(paths: dict[str, str],
+                   read_mode: str,
+                   out_format: str) -> None:
+    """Run extract_sites.py as a script, with a config pointing to the fixtures."""
+    config = {"geo": {"path": paths["domain"], "lat_name": "yc", "lon_name": "xc"},
+              "stations": {"path": paths["stations"], "id_col": "Stations_id",
+                           "lat_col": "geograph.Breite", "lon_col": "geograph.Laenge"},
+              "data": {"path": os.path.join(paths["history"], "*.nc"),
+                       "variables": [{"name": "GPP", "unit": "gC/m^2/s"}, {"name": "TSOI", "unit": "K"}],
+                       "read_mode": read_mode,
+                       "workers": 1},
+              "out": {"path": f"out/out.{out_format}", "format": out_format, "layout": "columns"}}
+
+    with tempfile.TemporaryDirectory() as run_dir:
+        with open(os.path.join(run_dir, "config_extract_sites.yaml"), "w") as f:
+            yaml.safe_dump(config, f)
+        cwd = os.getcwd()
+        os.chdir(run_dir)
+        try:
+            runpy.run_path(os.path.join(extract_dir, "extract_sites.py"), run_name="__main__")
+        finally:
+            os.chdir(cwd)
+
+
+def case_extract_points(paths: dict[str, str],
+                        scale: dict) -> None:
+    """Full extraction to CSV, reading only the station cells."""
+    run_extraction(paths, "points", "csv")
+
+
+def case_extract_full(paths: dict[str, str],
+                      scale: dict) -> None:
+    """Full extraction to CSV, loading whole variables with MFDataset."""
+    run_extraction(paths, "full", "csv")
+
+
+def case_build_forcing(paths: dict[str, str],
+                       scale: dict) -> None:
+    """Reading the ICOS CSV, unit conversion and resampling of all forcing variables."""
+    from icos_merge import read_merged
+    import single_point_observations as spo
+
+    data = read_merged(paths["icos"], na_values=spo.na_values)
+    scale_, offset = spo.conversion_factors({v: spo.src_units[v] for v in spo.var_names},
+                                            spo.dst_units, spo.scaling_factors)
+    spo.build_forcing(data, spo.var_names, scale_, offset, spo.t_res)
+
+
+def case_forcing_writer(paths: dict[str, str],
+                        scale: dict) -> None:
+    """Complete monthly forcing generation: read, convert, gap fill and write all months."""
+    import single_point_observations as spo
+
+    with tempfile.TemporaryDirectory() as outdir:
+        spo.write_forcing(paths["icos"], outdir, 50.0, 6.0,
+                          2000, 1, 2000 + scale["years"] - 1, 12)
+
+
+cases: dict = {"closest_cell": case_closest_cell,
+               "cell_index": case_cell_index,
+               "extract_points": case_extract_points,
+               "extract_full": case_extract_full,
+               "build_forcing": case_build_forcing,
+               "forcing_writer": case_forcing_writer}
+
+# Modules imported before the timer starts, import time is not part of a case
+preload: dict[str, list[str]] = {"closest_cell": ["netCDF4", "pandas", "extract_sites"],
+                                 "cell_index": ["netCDF4", "pandas", "spatial_index", "scipy.spatial"],
+                                 "extract_points": ["extract_sites", "point_reader", "writers"],
+                                 "extract_full": ["extract_sites", "point_reader", "writers"],
+                                 "build_forcing": ["pint", "icos_merge", "single_point_observations"],
+                                 "forcing_writer": ["single_point_observations"]}
+
+
+def measure(name: str,
+            paths: dict[str, str],
+            scale: dict,
+            trace: bool = False) -> dict:
+    """
+    Wall time and process peak RSS of one case, run in a worker process.
+
+    With trace, the peak of the Python heap is recorded with tracemalloc
+    instead of the time, tracing slows down pure Python code considerably.
+    """
+    import warnings
+    warnings.simplefilter("ignore")
+
+    for module in preload.get(name, []):
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if trace:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+
+    cases[name](paths, scale)
+
+    seconds = time.perf_counter() - t0
+    heap_peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    tracemalloc.stop()
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return {"seconds": seconds,
+            "heap_peak_mb": heap_peak / 2**20,
+            "rss_peak_mb": rss_peak * unit / 2**20,
+            "rss_increase_mb": (rss_peak - rss_before) * unit / 2**20}
+
+
+def run_case(name: str,
+             paths: dict[str, str],
+             scale: dict,
+             repeat: int) -> dict:
+    """Best time over repeated runs and the memory use, each run in a fresh process."""
+    ctx = multiprocessing.get_context("spawn")
+
+    def run(trace: bool) -> dict:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            return pool.submit(measure, name, paths, scale, trace).result()
+
+    runs = [run(False) for _ in range(repeat)]
+    traced = run(True)
+
+    return {"seconds": round(min(r["seconds"] for r in runs), 4),
+            "seconds_all": [round(r["seconds"], 4) for r in runs],
+            "heap_peak_mb": round(traced["heap_peak_mb"], 2),
+            "rss_peak_mb": round(max(r["rss_peak_mb"] for r in runs), 2),
+            "rss_increase_mb": round(max(r["rss_increase_mb"] for r in runs), 2)}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict,
+            old: dict) -> None:
+    """Print time and memory ratios against an earlier result file."""
+    print(f"\ncompared to {old.get('commit') or 'previous run'}")
+    for name, r in results["cases"].items():
+        o = old.get("cases", {}).get(name)
+        if o is None:
+            continue
+        print(f"{name:16s} time x{r['seconds'] / o['seconds']:6.2f}  "
+              f"rss x{r['rss_peak_mb'] / o['rss_peak_mb']:6.2f}  "
+              f"heap x{r['heap_peak_mb'] / max(o['heap_peak_mb'], 1e-6):6.2f}")
+    if old.get("scale") != results["scale"]:
+        print("note: fixture scale differs from the earlier run")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nlat", type=int, default=200)
+    parser.add_argument("--nlon", type=int, default=240)
+    parser.add_argument("--nlevsoi", type=int, default=10)
+    parser.add_argument("--stations", type=int, default=100)
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--cases", default=",".join(cases), help="comma separated, default all")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--fixtures", default=None, help="keep the fixtures in this directory")
+    parser.add_argument("--out", default=None, help="write results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run")
+    args = parser.parse_args()
+
+    scale = {"nlat": args.nlat, "nlon": args.nlon, "nlevsoi": args.nlevsoi,
+             "stations": args.stations, "years": args.years}
+
+    results = {"commit": git_commit(),
+               "python": platform.python_version(),
+               "numpy": np.__version__,
+               "machine": platform.machine(),
+               "cpus": os.cpu_count(),
+               "scale": scale,
+               "cases": {}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        root = args.fixtures or tmp
+        t0 = time.perf_counter()
+        paths = make_fixtures(root, args.nlat, args.nlon, args.stations, args.years, args.nlevsoi)
+        print(f"fixtures written to {root} in {time.perf_counter() - t0:.1f} s")
+
+        for name in args.cases.split(","):
+            if name not in cases:
+                raise SystemExit(f"Unknown case '{name}', available: {', '.join(cases)}")
+            r = results["cases"][name] = run_case(name, paths, scale, args.repeat)
+            print(f"{name:16s} {r['seconds']:8.3f} s  heap {r['heap_peak_mb']:8.1f} MB  "
+                  f"rss {r['rss_peak_mb']:8.1f} MB (+{r['rss_increase_mb']:.1f})")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
@@ -0,0 +1,152 @@
+"""
+Synthetic eCLM-like fixtures for the benchmarks: a domain file, 8-daily
+history files, a station list and a merged ICOS observation CSV.
+
+The layout follows the production inputs (EUR-0275 domain with yc/xc,
+join_8d history files with GPP and TSOI, ICOS_single_point_<station>.csv),
+the size is set by the grid, number of stations and years.
+"""
+import os
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+
+
+# Approximate extent of the EUR-0275 domain
+lat_range: tuple[float, float] = (27.0, 72.0)
+lon_range: tuple[float, float] = (-45.0, 65.0)
+
+# 8-daily output, as in the join_8d archive
+steps_per_year: int = 46
+
+
+def make_domain(path: str,
+                nlat: int,
+                nlon: int) -> None:
+    """Domain file with 2D cell centre coordinates yc/xc and a land mask."""
+    lat = np.linspace(*lat_range, nlat)
+    lon = np.linspace(*lon_range, nlon)
+    lon2d, lat2d = np.meshgrid(lon, lat)
+
+    with nc.Dataset(path, "w") as ds:
+        ds.createDimension("nj", nlat)
+        ds.createDimension("ni", nlon)
+        ds.createVariable("yc", "f8", ("nj", "ni"))[:] = lat2d
+        ds.createVariable("xc", "f8", ("nj", "ni"))[:] = lon2d
+        mask = ds.createVariable("mask", "i4", ("nj", "ni"))
+        mask[:] = (np.sin(np.radians(lat2d) * 7) + np.cos(np.radians(lon2d) * 5) > -0.5).astype(np.int32)
+
+
+def make_history(outdir: str,
+                 nlat: int,
+                 nlon: int,
+                 years: int,
+                 nlevsoi: int = 10,
+                 start_year: int = 2000,
+                 seed: int = 0) -> list[str]:
+    """
+    One history file per year with a 3D (GPP) and a 4D (TSOI) variable.
+
+    Files are NETCDF4_CLASSIC so they can be aggregated with MFDataset.
+
+    Returns:
+        list[str]: written files
+    """
+    os.makedirs(outdir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    files = []
+
+    for k in range(years):
+        year = start_year + k
+        path = os.path.join(outdir, f"hist.{year:04d}-01-01.nc")
+        days = 365 * k + 8 * np.arange(steps_per_year)
+        season = np.sin(2 * np.pi * (days % 365) / 365)[:, np.newaxis, np.newaxis]
+
+        with nc.Dataset(path, "w", format="NETCDF4_CLASSIC") as ds:
+            ds.createDimension("time", None)
+            ds.createDimension("levsoi", nlevsoi)
+            ds.createDimension("lat", nlat)
+            ds.createDimension("lon", nlon)
+
+            t = ds.createVariable("time", "f8", ("time",))
+            t.units = f"days since {start_year:04d}-01-01 00:00:00"
+            t.calendar = "noleap"
+            t[:] = days
+
+            gpp = ds.createVariable("GPP", "f4", ("time", "lat", "lon"), fill_value=1e36)
+            gpp.units = "gC/m^2/s"
+            gpp[:] = (1e-4 * (1 + season) * rng.random((steps_per_year, nlat, nlon))).astype(np.float32)
+
+            tsoi = ds.createVariable("TSOI", "f4", ("time", "levsoi", "lat", "lon"), fill_value=1e36)
+            tsoi.units = "K"
+            for lev in range(nlevsoi):
+                tsoi[:, lev] = (283 + 10 * season / (1 + lev)
+                                + rng.normal(0, 0.5, (steps_per_year, nlat, nlon))).astype(np.float32)
+
+        files.append(path)
+
+    return files
+
+
+def make_stations(path: str,
+                  n_stations: int,
+                  seed: int = 0) -> None:
+    """Station list with the column names of the CP station data."""
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({"Stations_id": np.arange(n_stations),
+                  "geograph.Breite": rng.uniform(*lat_range, n_stations),
+                  "geograph.Laenge": rng.uniform(*lon_range, n_stations)}).to_csv(path, index=False)
+
+
+def make_icos_csv(path: str,
+                  years: int,
+                  start_year: int = 2000,
+                  missing_fraction: float = 0.02,
+                  seed: int = 0) -> None:
+    """
+    Half-hourly merged ICOS table in the units of the ICOS datasets,
+    with -9999 for missing values.
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(f"{start_year}-01-01", f"{start_year + years}-01-01", freq="30min", inclusive="left")
+    n = len(index)
+    hours = index.hour.to_numpy() + index.minute.to_numpy() / 60
+    day = np.sin(np.pi * (hours - 6) / 12).clip(0)
+
+    df = pd.DataFrame({"TA": 10 + 8 * day + rng.normal(0, 1, n),
+                       "RH": rng.uniform(40, 100, n),
+                       "WS": rng.gamma(2, 1.5, n),
+                       "PA": 100 + rng.normal(0, 0.3, n),
+                       "P": rng.exponential(0.2, n) * (rng.random(n) < 0.1),
+                       "SW_IN": 800 * day + rng.normal(0, 20, n).clip(0),
+                       "LW_IN": 320 + rng.normal(0, 15, n)}, index=pd.Index(index, name="TIMESTAMP"))
+
+    df = df.mask(rng.random(df.shape) < missing_fraction, -9999.0)
+    df.to_csv(path)
+
+
+def make_fixtures(root: str,
+                  nlat: int,
+                  nlon: int,
+                  n_stations: int,
+                  years: int,
+                  nlevsoi: int = 10) -> dict[str, str]:
+    """
+    Write all fixtures below root.
+
+    Returns:
+        dict[str, str]: paths of the domain, history directory, station list and ICOS CSV
+    """
+    paths = {"domain": os.path.join(root, "domain.lnd.synthetic.nc"),
+             "history": os.path.join(root, "join_8d"),
+             "stations": os.path.join(root, "in", "stations.csv"),
+             "icos": os.path.join(root, "out", "csv", "ICOS_single_point_XX-Syn.csv")}
+
+    for p in paths.values():
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+
+    make_domain(paths["domain"], nlat, nlon)
+    make_history(paths["history"], nlat, nlon, years, nlevsoi)
+    make_stations(paths["stations"], n_stations)
+    make_icos_csv(paths["icos"], years)
+    return paths
@@ -0,0 +1,280 @@
+"""
+Command line interface of the eCLM pre- and postprocessing tools.
+
+    python src/cli.py extract postprocessing/extract_sites/config_extract_sites.yaml
+    python src/cli.py aggregate postprocessing/extract_sites/config_extract_sites.yaml
+    python src/cli.py fetch forcings/config_ICOS.yaml
+    python src/cli.py forcing forcings/config_ICOS.yaml --start 2022-06 --end 2022-07
+    python src/cli.py batch forcings/config_batch.yaml
+    python src/cli.py export forcings/config_batch.yaml --station FR-Aur --months 2022-06
+    python src/cli.py run jobs.yaml
+
+Every command runs in the directory of its config file, so relative paths
+in the configs keep their meaning. "run" executes a list of jobs in this
+process, which saves the Python, pandas, pint and netCDF4 start-up per job:
+
+    jobs:
+      - {command: extract, config: postprocessing/extract_sites/config_extract_sites.yaml}
+      - {command: forcing, config: forcings/config_ICOS.yaml, station: FI-Hyy,
+         lat: 61.84741, lon: 24.29477, start: "2022-01", end: "2022-12"}
+
+The tools are imported when a command runs, not at start-up. With
+--stage-log every run appends timing, memory and I/O per stage to a JSON
+lines file, see stage_log.py.
+"""
+import os
+import sys
+import time
+import argparse
+import traceback
+
+import yaml
+
+src_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Directories of the tool modules, they import their siblings and the
+# shared modules of src/ by name. Run directly, the tools add src/ themselves.
+tool_dirs: list[str] = [src_dir,
+                        os.path.join(src_dir, "postprocessing", "extract_sites"),
+                        os.path.join(src_dir, "forcings"),
+                        os.path.join(src_dir, "static_input"),
+                        os.path.join(src_dir, "input_adjustments")]
+
+for d in tool_dirs:
+    if d not in sys.path:
+        sys.path.append(d)
+
+
+def load_config(path: str) -> dict:
+    with open(path) as f:
+        config = yaml.safe_load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"Configuration file {path} is empty or invalid.")
+    return config
+
+
+def extract(config: dict,
+            **kwargs) -> str:
+    """Station time series extraction, see extract_sites.py."""
+    from extract_sites import extract_sites
+    return extract_sites(config)
+
+
+def aggregate(config: dict,
+              **kwargs) -> list[str]:
+    """Station, neighbourhood and regional aggregates with xarray and dask, see aggregate_sites.py."""
+    from aggregate_sites import aggregate_sites
+    return aggregate_sites(config)
+
+
+def fetch(config: dict,
+          station: str | None = None,
+          **kwargs) -> str:
+    """Download and merge the ICOS data of a station, see single_point_from_ICOS.py."""
+    from single_point_from_ICOS import fetch_station, outdir, cache_dir, workers
+
+    download = config.get("download", {})
+    return fetch_station(station or config["station"]["id"],
+                         config["datasets"],
+                         config["auth"]["token"],
+                         outdir=download.get("outdir", outdir),
+                         cache_dir=download.get("cache_dir", cache_dir),
+                         workers=download.get("workers", workers),
+                         refresh=download.get("refresh", False))
+
+
+def forcing(config: dict,
+            station: str | None = None,
+            lat: float | None = None,
+            lon: float | None = None,
+            start: str | None = None,
+            end: str | None = None,
+            **kwargs) -> list[str]:
+    """
+    Monthly forcing files of one station, see single_point_observations.py.
+
+    Arguments not given fall back to the station of the config and the
+    settings of single_point_observations.py. The coordinates of another
+    station than the one of the config must be given.
+    """
+    import pandas as pd
+    import single_point_observations as spo
+
+    if station is not None and station != config["station"]["id"]:
+        if lat is None or lon is None:
+            raise ValueError(f"Station {station} is not the station of the config "
+                             f"({config['station']['id']}), give its lat and lon.")
+    else:
+        station = config["station"]["id"]
+        lat = config["station"].get("lat", spo.lat) if lat is None else lat
+        lon = config["station"].get("lon", spo.lon) if lon is None else lon
+    start = pd.Period(start, freq="M") if start else pd.Period(year=spo.start_year, month=spo.start_month, freq="M")
+    end = pd.Period(end, freq="M") if end else pd.Period(year=spo.end_year, month=spo.end_month, freq="M")
+
+    return spo.write_forcing(kwargs.get("infile", spo.infile).format(station=station),
+                             kwargs.get("outdir", spo.outdir).format(station=station),
+                             lat, lon,
+                             start.year, start.month,
+                             end.year, end.month)
+
+
+def batch(config: dict,
+          **kwargs) -> str:
+    """Forcing files of several stations in worker processes, see batch_forcings.py."""
+    from batch_forcings import run_batch
+
+    report = run_batch(config["stations"], config, workers=config.get("workers", 1))
+    os.makedirs(os.path.dirname(config["report"]) or ".", exist_ok=True)
+    report.to_csv(config["report"], index=False)
+
+    n_failed = int((report["status"] != "ok").sum())
+    if n_failed:
+        raise RuntimeError(f"{n_failed} station(s) failed, see {config['report']}")
+    return config["report"]
+
+
+def export(config: dict,
+           station: str | None = None,
+           months: str | None = None,
+           **kwargs) -> list[str]:
+    """Monthly forcing files from a forcing cube, see forcing_cube.py."""
+    from forcing_cube import export_monthly
+
+    cube = config["cube"]
+    export = config.get("export", {})
+    return export_monthly(cube.get("format", "netcdf"),
+                          cube["path"],
+                          export.get("outdir", config["outdir"]),
+                          stations=[station] if station else export.get("stations"),
+                          months=months.split(",") if months else export.get("months"))
+
+
+commands: dict = {"extract": extract,
+                  "aggregate": aggregate,
+                  "fetch": fetch,
+                  "forcing": forcing,
+                  "batch": batch,
+                  "export": export}
+
+
+def run_job(command: str,
+            config_path: str,
+            **kwargs) -> object:
+    """
+    Run one command in the directory of its config file.
+
+    Args:
+        command (str): one of commands
+        config_path (str): config file of the command
+        **kwargs: further arguments of the command
+
+    Returns:
+        object: result of the command, e.g. the written files
+    """
+    if command not in commands:
+        raise ValueError(f"Unknown command '{command}', use one of {', '.join(commands)}.")
+
+    config_path = os.path.abspath(config_path)
+    config = load_config(config_path)
+
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(config_path))
+    try:
+        return commands[command](config, **kwargs)
+    finally:
+        os.chdir(cwd)
+
+
+def run_jobs(jobs: list[dict]) -> list[dict]:
+    """
+    Run several jobs one after the other in this process.
+
+    A failing job is reported and does not stop the following jobs.
+
+    Args:
+        jobs (list[dict]): entries with command, config and further arguments
+
+    Returns:
+        list[dict]: command, config, status, seconds and error per job
+    """
+    results = []
+
+    for job in jobs:
+        job = dict(job)
+        command, config_path = job.pop("command"), job.pop("config")
+        result = {"command": command, "config": config_path, "status": "ok", "seconds": 0.0, "error": ""}
+        t0 = time.perf_counter()
+
+        try:
+            run_job(command, config_path, **job)
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+
+        result["seconds"] = round(time.perf_counter() - t0, 3)
+        results.append(result)
+        print(f"{command} {config_path}: {result['status']} in {result['seconds']:.1f} s"
+              + (f" ({result['error']})" if result["error"] else ""))
+
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stage-log", default=None,
+                        help="append timing, memory and I/O per stage as JSON lines to this file")
+    parser.add_argument("--profile", action="store_true",
+                        help="sample the call stacks of each stage into <stage-log>.stacks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("extract", "aggregate", "batch"):
+        p = sub.add_parser(name, help=commands[name].__doc__.strip().splitlines()[0])
+        p.add_argument("config")
+
+    p = sub.add_parser("fetch", help=fetch.__doc__.strip().splitlines()[0])
+    p.add_argument("config", help="config_ICOS.yaml")
+    p.add_argument("--station", default=None, help="station id, default from the config")
+
+    p = sub.add_parser("forcing", help=forcing.__doc__.strip().splitlines()[0])
+    p.add_argument("config", help="config_ICOS.yaml")
+    p.add_argument("--station", default=None, help="station id, default from the config")
+    p.add_argument("--lat", type=float, default=None)
+    p.add_argument("--lon", type=float, default=None)
+    p.add_argument("--start", default=None, help="first month as YYYY-MM")
+    p.add_argument("--end", default=None, help="last month as YYYY-MM")
+
+    p = sub.add_parser("export", help=export.__doc__.strip().splitlines()[0])
+    p.add_argument("config", help="config_batch.yaml")
+    p.add_argument("--station", default=None, help="station id, default all or from the config")
+    p.add_argument("--months", default=None, help="comma separated YYYY-MM, default all or from the config")
+
+    p = sub.add_parser("run", help="run the jobs of a YAML file in one process")
+    p.add_argument("jobs")
+
+    args = vars(parser.parse_args(argv))
+    command = args.pop("command")
+
+    # picked up by stage_log.StageLog, also in worker processes
+    stage_log, profile = args.pop("stage_log"), args.pop("profile")
+    if stage_log:
+        os.environ["STAGE_LOG"] = os.path.abspath(stage_log)
+    if profile:
+        os.environ["STAGE_PROFILE"] = "1"
+
+    if command == "run":
+        jobs_path = os.path.abspath(args["jobs"])
+        jobs = load_config(jobs_path)["jobs"]
+        # config paths of the jobs are relative to the jobs file
+        for job in jobs:
+            job["config"] = os.path.join(os.path.dirname(jobs_path), job["config"])
+        results = run_jobs(jobs)
+        return int(any(r["status"] != "ok" for r in results))
+
+    run_job(command, args.pop("config"), **{k: v for k, v in args.items() if v is not None})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+File helpers shared by the pipelines in src/: content hashes of input files
+and atomic writes of caches, manifests and state files.
+"""
+import os
+import hashlib
+import threading
+from collections.abc import Callable
+
+
+def file_digest(path: str,
+                block_size: int = 1 << 20) -> str:
+    """
+    Content hash of a file, read in blocks.
+
+    Args:
+        path (str): file path
+        block_size (int): read block size in bytes
+
+    Returns:
+        str: hex digest of the file content
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def atomic_write(path: str,
+                 write: Callable[[str], None],
+                 suffix: str = "") -> None:
+    """
+    Write a file under a temporary name and rename it into place, so that
+    concurrent readers never see a partial file.
+
+    Args:
+        path (str): file to write
+        write (Callable[[str], None]): writes the content to the path it is given
+        suffix (str): ending of the temporary name, e.g. ".npz" for np.savez
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp{suffix}"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
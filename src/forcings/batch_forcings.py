@@ -0,0 +1,167 @@
+import os
+import time
+import traceback
+import yaml
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+config_file: str = "config_batch.yaml"
+
+
+def run_station(station: dict,
+                settings: dict) -> dict:
+    
+    """
+    Generate the forcing files of one station, errors are returned not raised.
+    
+    Args:
+        station (dict): station entry with id, lat, lon, start and end (YYYY-MM)
+        settings (dict): batch settings (infile, outdir, fetch, icos_config)
+        
+    Returns:
+        dict: station id, status, number of files, seconds and error message
+    """
+    
+    t0 = time.perf_counter()
+    
+    result = {"station": station["id"], "status": "ok", "files": 0, "seconds": 0.0, "error": ""}
+    
+    try:
+        
+        from single_point_observations import write_forcing, station_forcing
+        
+        infile = settings["infile"].format(station=station["id"])
+        
+        if settings.get("fetch", False):
+            
+            from single_point_from_ICOS import fetch_station
+            
+            icos = yaml.safe_load(open(settings["icos_config"]))
+            infile = fetch_station(station["id"], icos["datasets"], icos["auth"]["token"],
+                                   outdir=os.path.dirname(infile))
+        
+        start = pd.Period(station["start"], freq="M")
+        end = pd.Period(station["end"], freq="M")
+        
+        if settings.get("output", "monthly") == "cube":
+            
+            # written into the cube by run_batch
+            result["forcing"], result["report"] = station_forcing(infile,
+                                                                  start.year, start.month,
+                                                                  end.year, end.month)
+        
+        else:
+            
+            files = write_forcing(infile,
+                                  settings["outdir"].format(station=station["id"]),
+                                  station["lat"], station["lon"],
+                                  start.year, start.month,
+                                  end.year, end.month)
+            
+            result["files"] = len(files)
+        
+    except Exception as e:
+        
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    
+    result["seconds"] = round(time.perf_counter() - t0, 3)
+    
+    return result
+
+
+def run_batch(stations: list[dict],
+              settings: dict,
+              workers: int = 1) -> pd.DataFrame:
+    
+    """
+    Generate the forcing files of several stations in worker processes.
+    
+    A failing station is reported and does not stop the other stations.
+    
+    Args:
+        stations (list[dict]): station entries, see run_station
+        settings (dict): batch settings, see run_station
+        workers (int): number of worker processes
+        
+    Returns:
+        pd.DataFrame: one row per station with status, files, seconds and error
+    """
+    
+    results = []
+    reports = []
+    cube = None
+    
+    if settings.get("output", "monthly") == "cube":
+        
+        from single_point_observations import t_res, dst_units, var_names, float32_output
+        from forcing_cube import open_cube, cube_axis
+        
+        cube_settings = settings["cube"]
+        os.makedirs(os.path.dirname(cube_settings["path"]) or ".", exist_ok=True)
+        cube = open_cube(cube_settings.get("format", "netcdf"), cube_settings["path"], "w",
+                         sites=stations,
+                         time=cube_axis(stations, t_res),
+                         units={v: dst_units[v] for v in var_names},
+                         dtype="float32" if float32_output else "float64",
+                         time_chunk=cube_settings.get("time_chunk", 8760),
+                         complevel=cube_settings.get("complevel", 4))
+        index = {s["id"]: k for k, s in enumerate(stations)}
+    
+    try:
+        
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            
+            futures = [pool.submit(run_station, s, settings) for s in stations]
+            
+            for f in as_completed(futures):
+                
+                r = f.result()
+                
+                forcing, report = r.pop("forcing", None), r.pop("report", None)
+                if forcing is not None:
+                    try:
+                        cube.write_site(index[r["station"]], forcing)
+                        r["files"] = 1
+                    except Exception as e:
+                        r["status"] = "failed"
+                        r["error"] = f"{type(e).__name__}: {e}"
+                        traceback.print_exc()
+                if report is not None:
+                    reports.append(report.assign(station=r["station"]))
+                
+                results.append(r)
+                print(f"{r['station']}: {r['status']}, {r['files']} file(s) in {r['seconds']:.1f} s"
+                      + (f" ({r['error']})" if r["error"] else ""))
+    
+    finally:
+        
+        if cube is not None:
+            cube.close()
+            if reports:
+                pd.concat(reports).to_csv(f"{settings['cube']['path']}.gap_report.csv")
+    
+    order = {s["id"]: i for i, s in enumerate(stations)}
+    
+    return pd.DataFrame(results).sort_values("station", key=lambda c: c.map(order), ignore_index=True)
+
+
+if __name__ == "__main__":
+    
+    config = yaml.safe_load(open(config_file))
+    
+    if not isinstance(config, dict): 
+        raise ValueError("Configuration file is empty or not found.")
+    
+    report = run_batch(config["stations"], config, workers=config.get("workers", 1))
+    
+    os.makedirs(os.path.dirname(config["report"]) or ".", exist_ok=True)
+    report.to_csv(config["report"], index=False)
+    
+    n_failed = (report["status"] != "ok").sum()
+    print(f"{len(report) - n_failed} station(s) done, {n_failed} failed, report in {config['report']}")
+    
+    if n_failed:
+        raise SystemExit(1)
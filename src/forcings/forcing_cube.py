@@ -0,0 +1,275 @@
+"""
+Forcing of many stations in one chunked (site, time) store, NetCDF or Zarr,
+instead of one small file per station and month.
+
+The monthly eCLM forcing files are exported from the cube only when needed:
+
+    python forcing_cube.py            # exports the stations and months of config_batch.yaml
+"""
+import yaml
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+
+from forcing_writer import long_names, global_attrs
+
+
+config_file: str = "config_batch.yaml"
+
+
+def cube_time(time_units: str,
+              hours: np.ndarray) -> pd.DatetimeIndex:
+    """Time stamps from hours since the reference time in the units."""
+    start = pd.Timestamp(time_units.split("since", 1)[1].strip())
+    return start + pd.to_timedelta(np.asarray(hours, dtype=np.float64), unit="h")
+
+
+def cube_axis(stations: list[dict],
+              t_res: str) -> pd.DatetimeIndex:
+    """Common time axis of all stations, from the first start month to the last end month."""
+    start = min(pd.Period(s["start"], freq="M") for s in stations).start_time
+    end = max(pd.Period(s["end"], freq="M") for s in stations).end_time
+    return pd.date_range(start, end, freq=t_res)
+
+
+class NetCDFCube:
+    """
+    Single NetCDF file with (site, time) variables, chunked per site.
+
+    Args:
+        path (str): file
+        mode (str): "w" to create, "r" to read, "a" to write stations into an existing cube
+        sites (list[dict]): stations with id, lat and lon ("w" only)
+        time (pd.DatetimeIndex): common time axis ("w" only)
+        units (dict[str, str]): unit per forcing variable ("w" only)
+        dtype (str): data type of the forcing variables
+        time_chunk (int): chunk length along time
+        complevel (int): zlib compression level, 0 for uncompressed
+    """
+
+    def __init__(self,
+                 path: str,
+                 mode: str = "r",
+                 sites: list[dict] | None = None,
+                 time: pd.DatetimeIndex | None = None,
+                 units: dict[str, str] | None = None,
+                 dtype: str = "float64",
+                 time_chunk: int = 8760,
+                 complevel: int = 4):
+        self.path = path
+
+        if mode in ("r", "a"):
+            self.ds = nc.Dataset(path, mode)
+            self._read_meta()
+            return
+
+        self.ds = nc.Dataset(path, "w", format="NETCDF4")
+        self.ds.setncatts(global_attrs)
+        self.ds.createDimension("site", len(sites))
+        self.ds.createDimension("time", len(time))
+
+        time_units = f"hours since {time[0]:%Y-%m-%d %H:%M:%S}"
+        t = self.ds.createVariable("time", np.float64, ("time",))
+        t.setncatts({"units": time_units, "calendar": "standard", "axis": "T"})
+        t[:] = (time - time[0]) / pd.Timedelta("1h")
+
+        self.ds.createVariable("site_id", str, ("site",))[:] = np.array([str(s["id"]) for s in sites], dtype=object)
+        self.ds.createVariable("lat", np.float64, ("site",))[:] = [s["lat"] for s in sites]
+        self.ds.createVariable("lon", np.float64, ("site",))[:] = [s["lon"] for s in sites]
+
+        for v, unit in units.items():
+            var = self.ds.createVariable(v, dtype, ("site", "time"), zlib=complevel > 0, complevel=complevel,
+                                         shuffle=True, chunksizes=(1, min(time_chunk, len(time))),
+                                         fill_value=np.nan)
+            var.setncatts({"units": unit, "long_name": long_names.get(v, v)})
+
+        self._read_meta()
+
+    def _read_meta(self) -> None:
+        self.site_ids = [str(s) for s in self.ds["site_id"][:]]
+        self.lats = np.asarray(self.ds["lat"][:])
+        self.lons = np.asarray(self.ds["lon"][:])
+        self.time = cube_time(self.ds["time"].units, self.ds["time"][:])
+        self.units = {v: var.units for v, var in self.ds.variables.items() if var.dimensions == ("site", "time")}
+
+    def write_site(self,
+                   k: int,
+                   forcing: pd.DataFrame) -> None:
+        """Write the forcing of station k, time steps outside the cube axis are dropped."""
+        forcing = forcing.reindex(self.time)
+        for v in self.units:
+            if v in forcing.columns:
+                self.ds[v][k, :] = forcing[v].to_numpy()
+
+    def read_site(self,
+                  k: int) -> pd.DataFrame:
+        """Forcing of station k on the cube time axis."""
+        return pd.DataFrame({v: np.ma.filled(self.ds[v][k, :].astype(np.float64), np.nan) for v in self.units},
+                            index=self.time)
+
+    def close(self) -> None:
+        self.ds.close()
+
+
+class ZarrCube:
+    """
+    Zarr store with (site, time) variables, one chunk column per site.
+
+    Stations are written as regions of the store, so the store is never
+    held in memory. Needs xarray, dask and zarr. Arguments as NetCDFCube,
+    complevel is not used, the store keeps the default Zarr compressor.
+    """
+
+    def __init__(self,
+                 path: str,
+                 mode: str = "r",
+                 sites: list[dict] | None = None,
+                 time: pd.DatetimeIndex | None = None,
+                 units: dict[str, str] | None = None,
+                 dtype: str = "float64",
+                 time_chunk: int = 8760,
+                 complevel: int = 4):
+        import xarray as xr
+        import dask.array as da
+
+        self.path = path
+
+        if mode == "w":
+            n_s, n_t = len(sites), len(time)
+            chunks = (1, min(time_chunk, n_t))
+            data_vars = {v: (("site", "time"), da.full((n_s, n_t), np.nan, dtype=dtype, chunks=chunks),
+                             {"units": unit, "long_name": long_names.get(v, v)})
+                         for v, unit in units.items()}
+            coords = {"time": time,
+                      "site_id": ("site", np.array([str(s["id"]) for s in sites])),
+                      "lat": ("site", np.array([s["lat"] for s in sites], dtype=np.float64)),
+                      "lon": ("site", np.array([s["lon"] for s in sites], dtype=np.float64))}
+            # writes coordinates and metadata only, the data variables are written per site
+            xr.Dataset(data_vars, coords=coords, attrs=global_attrs).to_zarr(path, mode="w", compute=False)
+
+        self.ds = xr.open_zarr(path)
+        self.site_ids = [str(s) for s in self.ds["site_id"].values]
+        self.lats = self.ds["lat"].values
+        self.lons = self.ds["lon"].values
+        self.time = pd.DatetimeIndex(self.ds["time"].values)
+        self.units = {v: self.ds[v].attrs.get("units", "") for v in self.ds.data_vars}
+
+    def write_site(self,
+                   k: int,
+                   forcing: pd.DataFrame) -> None:
+        """Write the forcing of station k, time steps outside the cube axis are dropped."""
+        import xarray as xr
+
+        forcing = forcing.reindex(self.time)
+        region = xr.Dataset({v: (("site", "time"), forcing[v].to_numpy(dtype=self.ds[v].dtype)[np.newaxis])
+                             for v in self.units if v in forcing.columns})
+        region.to_zarr(self.path, region={"site": slice(k, k + 1), "time": slice(None)})
+
+    def read_site(self,
+                  k: int) -> pd.DataFrame:
+        """Forcing of station k on the cube time axis."""
+        site = self.ds[list(self.units)].isel(site=k).compute()
+        return pd.DataFrame({v: site[v].values.astype(np.float64) for v in self.units}, index=self.time)
+
+    def close(self) -> None:
+        self.ds.close()
+
+
+CUBES: dict[str, type] = {"netcdf": NetCDFCube,
+                          "zarr": ZarrCube}
+
+
+def open_cube(fmt: str,
+              path: str,
+              mode: str = "r",
+              **kwargs) -> NetCDFCube | ZarrCube:
+    """
+    Open or create a forcing cube.
+
+    Args:
+        fmt (str): "netcdf" or "zarr"
+        path (str): file or store
+        mode (str): "w" to create, "r" to read, "a" to add stations (NetCDF)
+        **kwargs: sites, time, units, dtype, time_chunk and complevel when creating
+
+    Returns:
+        NetCDFCube | ZarrCube: open cube
+    """
+    if fmt not in CUBES:
+        raise ValueError(f"Unknown cube format '{fmt}', use one of {', '.join(CUBES)}.")
+    return CUBES[fmt](path, mode, **kwargs)
+
+
+def export_monthly(fmt: str,
+                   path: str,
+                   outdir: str,
+                   stations: list[str] | None = None,
+                   months: list[str] | None = None,
+                   **kwargs) -> list[str]:
+    """
+    Split a forcing cube into the monthly eCLM forcing files of single_point_observations.py.
+
+    Each station is read once. Files cover the time steps of the station from
+    its first to its last value, as written by single_point_observations.py.
+
+    Args:
+        fmt (str): "netcdf" or "zarr"
+        path (str): cube file or store
+        outdir (str): output directory, {station} is replaced by the station id
+        stations (list[str] | None): station ids to export, all if None
+        months (list[str] | None): months to export as YYYY-MM, all if None
+        **kwargs: latlon_buffer, complevel, time_chunk and float32_output,
+                  see single_point_observations.write_monthly_files
+
+    Returns:
+        list[str]: written files
+    """
+    from single_point_observations import write_monthly_files
+
+    cube = open_cube(fmt, path, "r")
+    written = []
+
+    try:
+        wanted = cube.site_ids if stations is None else [str(s) for s in stations]
+        periods = None if months is None else pd.PeriodIndex(months, freq="M")
+
+        for station in wanted:
+
+            k = cube.site_ids.index(station)
+            forcing = cube.read_site(k)
+
+            if periods is not None:
+                forcing = forcing[forcing.index.to_period("M").isin(periods)]
+
+            # the cube axis covers all stations, keep the time steps of this station
+            has_data = forcing.notna().any(axis=1).to_numpy()
+            if not has_data.any():
+                continue
+            forcing = forcing.iloc[np.argmax(has_data):len(has_data) - np.argmax(has_data[::-1])]
+
+            written += write_monthly_files(forcing, outdir.format(station=station),
+                                           float(cube.lats[k]), float(cube.lons[k]),
+                                           cube.units, **kwargs)
+    finally:
+        cube.close()
+
+    return written
+
+
+if __name__ == "__main__":
+
+    config = yaml.safe_load(open(config_file))
+
+    if not isinstance(config, dict):
+        raise ValueError("Configuration file is empty or not found.")
+
+    cube = config["cube"]
+    export = config.get("export", {})
+
+    files = export_monthly(cube.get("format", "netcdf"),
+                           cube["path"],
+                           export.get("outdir", config["outdir"]),
+                           stations=export.get("stations"),
+                           months=export.get("months"))
+
+    print(f"{len(files)} file(s) exported.")
@@ -0,0 +1,143 @@
+import datetime
+import numpy as np
+import netCDF4 as nc
+
+
+# Long names of the time-dependent forcing variables
+long_names: dict[str, str] = {"PRECTmms": "Precipitation",
+                              "PSRF": "surface pressure at the lowest atm level (2m above ground)",
+                              "FSDS": "Downward shortwave radiation",
+                              "FLDS": "Downward longwave radiation",
+                              "RH": "relative humidity at the lowest atm level (2m above ground)",
+                              "TBOT": "temperature at the lowest atm level (2m above ground)",
+                              "WIND": "wind at the lowest atm level (2m above ground)"}
+
+# Time-invariant (lat, lon) grid variables: long name, units
+grid_vars: dict[str, tuple[str, str]] = {"LONGXY": ("longitude", "degrees E"),
+                                         "LATIXY": ("latitude", "degrees N"),
+                                         "LONE": ("longitude of east edge", "degrees E"),
+                                         "LATN": ("latitude of north edge", "degrees N"),
+                                         "LONW": ("longitude of west edge", "degrees E"),
+                                         "LATS": ("latitude of south edge", "degrees N")}
+
+# Scalar edge variables: long name, units
+edge_vars: dict[str, tuple[str, str]] = {"EDGEN": ("northern edge in atmospheric data", "degrees N"),
+                                         "EDGEE": ("eastern edge in atmospheric data", "degrees E"),
+                                         "EDGES": ("southern edge in atmospheric data", "degrees N"),
+                                         "EDGEW": ("western edge in atmospheric data", "degrees E")}
+
+global_attrs: dict[str, str] = {"Forcings_generated_by": "Fernand Eloundou",
+                                "based_on": "data from ICOS portal",
+                                "used_for": "Singlepoint CLM 5.0"}
+
+
+def forcing_spec(units: dict[str, str],
+                 dtype: str = "float64") -> list[dict]:
+    """
+    Variable spec of the time-dependent forcing variables.
+
+    Args:
+        units (dict[str, str]): units per forcing variable, in output order
+        dtype (str): data type of all variables
+
+    Returns:
+        list[dict]: name, units, long_name and dtype per variable
+    """
+    return [{"name": v, "units": u, "long_name": long_names.get(v, v), "dtype": dtype}
+            for v, u in units.items()]
+
+
+def write_forcing_file(path: str,
+                       spec: list[dict],
+                       values: np.ndarray,
+                       time: np.ndarray,
+                       time_units: str,
+                       lat: float,
+                       lon: float,
+                       latbuffer: float,
+                       lonbuffer: float,
+                       complevel: int = 4,
+                       time_chunk: int | None = None) -> None:
+    """
+    Write one single-point forcing file.
+
+    All variables are defined first and then written in bulk. With
+    complevel > 0 the time-dependent variables are zlib compressed with
+    the shuffle filter, chunked along time. Uncompressed variables are
+    contiguous unless time_chunk is given.
+
+    Args:
+        path (str): output file
+        spec (list[dict]): variable spec, see forcing_spec
+        values (np.ndarray): forcing values (time, n_variables) in spec order
+        time (np.ndarray): time axis
+        time_units (str): units of the time axis
+        lat (float): site latitude
+        lon (float): site longitude
+        latbuffer (float): signed half size of the site cell in latitude
+        lonbuffer (float): half size of the site cell in longitude
+        complevel (int): zlib compression level, 0 for uncompressed
+        time_chunk (int | None): chunk length along time, whole file if None
+    """
+    n_t = len(time)
+    chunk = min(time_chunk or n_t, n_t) or 1
+
+    with nc.Dataset(path, "w") as dst:
+
+        dst.createDimension("scalar", 1)
+        dst.createDimension("lon", 1)
+        dst.createDimension("lat", 1)
+        dst.createDimension("time", n_t)
+
+        dst.setncatts({**global_attrs,
+                       "on_date": datetime.datetime.today().strftime("%Y%m%d%H%M")})
+
+        time_var = dst.createVariable("time", datatype=np.float32, dimensions=("time",))
+        time_var.setncatts({"long_name": "observation time",
+                            "units": time_units,
+                            "calendar": "gregorian",
+                            "axis": "T"})
+
+        grid_values = {"LONGXY": lon, "LATIXY": lat,
+                       "LONE": lon + lonbuffer, "LATN": lat + latbuffer,
+                       "LONW": lon - lonbuffer, "LATS": lat - latbuffer}
+
+        for name, (long_name, units) in grid_vars.items():
+            var = dst.createVariable(name, datatype=np.float32, dimensions=("lat", "lon"),
+                                     fill_value=np.float32(np.nan))
+            var.setncatts({"long_name": long_name, "units": units, "mode": "time-invariant"})
+
+        forcing_vars = []
+        for s in spec:
+            dtype = np.dtype(s["dtype"])
+            var = dst.createVariable(s["name"], datatype=dtype,
+                                     dimensions=("time", "lat", "lon"),
+                                     fill_value=dtype.type(np.nan),
+                                     zlib=complevel > 0,
+                                     complevel=complevel if complevel > 0 else 4,
+                                     shuffle=complevel > 0,
+                                     chunksizes=(chunk, 1, 1) if complevel > 0 or time_chunk else None)
+            var.setncatts({"long_name": s["long_name"],
+                           "units": s["units"],
+                           "missing_value": dtype.type(np.nan),
+                           "mode": "time-dependent"})
+            forcing_vars.append(var)
+
+        for name, (long_name, units) in edge_vars.items():
+            var = dst.createVariable(name, np.float32, ("scalar",))
+            var.setncatts({"long_name": long_name, "units": units, "mode": "time-invariant"})
+
+        # bulk writes
+        time_var[:] = time
+        for name, value in grid_values.items():
+            dst.variables[name][:, :] = value
+
+        values = np.asarray(values)
+        for k, var in enumerate(forcing_vars):
+            var[:, 0, 0] = values[:, k].astype(var.dtype, copy=False)
+
+        # location for site
+        dst.variables["EDGEN"][:] = lat
+        dst.variables["EDGES"][:] = lat
+        dst.variables["EDGEE"][:] = lon
+        dst.variables["EDGEW"][:] = lon
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+
+# Physically plausible range per forcing variable, in output units
+valid_ranges: dict[str, tuple[float, float]] = {"PRECTmms": (0.0, 0.1),
+                                                "PSRF": (5.0e4, 1.1e5),
+                                                "FSDS": (0.0, 1400.0),
+                                                "FLDS": (50.0, 600.0),
+                                                "RH": (0.0, 100.0),
+                                                "TBOT": (200.0, 340.0),
+                                                "WIND": (0.0, 60.0)}
+
+
+def gap_lengths(missing: np.ndarray) -> np.ndarray:
+    """
+    Length of the gap each time step belongs to, per column.
+
+    Args:
+        missing (np.ndarray): boolean array (time, n_variables)
+
+    Returns:
+        np.ndarray: gap length for missing steps, 0 elsewhere
+    """
+    n_t = missing.shape[0]
+    out = np.zeros(missing.shape, dtype=np.int64)
+    for k in range(missing.shape[1]):
+        m = missing[:, k]
+        # starts and ends of runs of missing values
+        edges = np.diff(np.concatenate([[0], m.astype(np.int8), [0]]))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        run = np.zeros(n_t + 1, dtype=np.int64)
+        np.add.at(run, starts, ends - starts)
+        np.add.at(run, ends, -(ends - starts))
+        out[:, k] = np.where(m, np.cumsum(run)[:n_t], 0)
+    return out
+
+
+def interpolate_short_gaps(values: np.ndarray,
+                           max_gap: int) -> np.ndarray:
+    """
+    Linear interpolation of interior gaps of at most max_gap steps.
+
+    Longer gaps and gaps at the start or end of the series stay NaN.
+
+    Args:
+        values (np.ndarray): array (time, n_variables)
+        max_gap (int): longest gap to interpolate, in time steps
+
+    Returns:
+        np.ndarray: boolean array of the interpolated steps
+    """
+    missing = np.isnan(values)
+    short = missing & (gap_lengths(missing) <= max_gap)
+    steps = np.arange(values.shape[0])
+
+    for k in np.flatnonzero(short.any(axis=0)):
+        valid = ~missing[:, k]
+        if valid.sum() < 2:
+            short[:, k] = False
+            continue
+        # only interior gaps, bounded by valid values on both sides
+        first, last = steps[valid][[0, -1]]
+        short[:, k] &= (steps > first) & (steps < last)
+        values[short[:, k], k] = np.interp(steps[short[:, k]], steps[valid], values[valid, k])
+
+    return short
+
+
+def fill_diurnal_cycle(values: np.ndarray,
+                       steps_per_day: int,
+                       offset: int,
+                       window_days: int) -> np.ndarray:
+    """
+    Fill gaps with the mean diurnal cycle of the surrounding days.
+
+    Each missing step gets the mean of the valid values at the same time of
+    day within +- window_days. Steps without any such value get the mean
+    diurnal cycle of the whole series.
+
+    Args:
+        values (np.ndarray): array (time, n_variables) on a regular time axis
+        steps_per_day (int): time steps per day
+        offset (int): position of the first step within its day
+        window_days (int): half width of the window in days
+
+    Returns:
+        np.ndarray: boolean array of the filled steps
+    """
+    n_t, n_v = values.shape
+    n_days = -(-(offset + n_t) // steps_per_day)
+
+    # (day, time of day, variable), padded to whole days
+    grid = np.full((n_days * steps_per_day, n_v), np.nan)
+    grid[offset:offset + n_t] = values
+    grid = grid.reshape(n_days, steps_per_day, n_v)
+
+    valid = ~np.isnan(grid)
+    csum = np.concatenate([np.zeros((1, steps_per_day, n_v)), np.cumsum(np.where(valid, grid, 0.0), axis=0)])
+    ccnt = np.concatenate([np.zeros((1, steps_per_day, n_v)), np.cumsum(valid, axis=0)])
+
+    lo = np.clip(np.arange(n_days) - window_days, 0, n_days)
+    hi = np.clip(np.arange(n_days) + window_days + 1, 0, n_days)
+    count = ccnt[hi] - ccnt[lo]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        window_mean = (csum[hi] - csum[lo]) / count
+        overall = csum[-1] / ccnt[-1]
+
+    fill = np.where(count > 0, window_mean, overall[np.newaxis])
+    fill = fill.reshape(-1, n_v)[offset:offset + n_t]
+
+    filled = np.isnan(values) & ~np.isnan(fill)
+    values[filled] = fill[filled]
+    return filled
+
+
+def gapfill(forcing: pd.DataFrame,
+            max_interp_gap: str = "3h",
+            window_days: int = 7,
+            ranges: dict[str, tuple[float, float]] = valid_ranges) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Quality control and gap filling of forcing time series.
+
+    1. values outside the physical range of a variable are set missing
+    2. interior gaps up to max_interp_gap are interpolated linearly
+    3. remaining gaps are filled with the mean diurnal cycle of the surrounding days
+
+    All steps work on the whole multi-year array at once.
+
+    Args:
+        forcing (pd.DataFrame): forcing on a regular DatetimeIndex, one column per variable
+        max_interp_gap (str): longest gap to interpolate, as a time span
+        window_days (int): half width of the diurnal cycle window in days
+        ranges (dict[str, tuple[float, float]]): valid range per variable
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: filled forcing, gap report per variable
+    """
+    step = pd.Timedelta(pd.tseries.frequencies.to_offset(forcing.index.freq or pd.infer_freq(forcing.index)))
+    steps_per_day = int(pd.Timedelta("1D") / step)
+    offset = int((forcing.index[0] - forcing.index[0].normalize()) / step)
+
+    values = forcing.to_numpy(dtype=np.float64, copy=True)
+    missing = np.isnan(values)
+
+    lower = np.array([ranges.get(c, (-np.inf, np.inf))[0] for c in forcing.columns])
+    upper = np.array([ranges.get(c, (-np.inf, np.inf))[1] for c in forcing.columns])
+    out_of_range = ~missing & ((values < lower) | (values > upper))
+    values[out_of_range] = np.nan
+
+    interpolated = interpolate_short_gaps(values, int(pd.Timedelta(max_interp_gap) / step))
+    diurnal = fill_diurnal_cycle(values, steps_per_day, offset, window_days)
+
+    report = pd.DataFrame({"n_steps": len(values),
+                           "missing": missing.sum(axis=0),
+                           "out_of_range": out_of_range.sum(axis=0),
+                           "interpolated": interpolated.sum(axis=0),
+                           "diurnal_filled": diurnal.sum(axis=0),
+                           "remaining": np.isnan(values).sum(axis=0)},
+                          index=pd.Index(forcing.columns, name="variable"))
+
+    return pd.DataFrame(values, index=forcing.index, columns=forcing.columns), report
@@ -0,0 +1,125 @@
+import os
+import re
+import sys
+import json
+import hashlib
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+try:
+    from file_utils import atomic_write
+except ImportError:
+    # run directly from its directory, file_utils.py is in src/
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from file_utils import atomic_write
+
+
+def icos_loader(uri: str) -> pd.DataFrame:
+    """Download an ICOS data object as a table from the carbon portal."""
+    from icoscp.dobj import Dobj
+    return Dobj(uri).data
+
+
+def object_key(uri: str) -> str:
+    """
+    Cache key of a data object.
+
+    ICOS data object URIs end with the hash of the object content, which
+    is used directly. Other URIs are hashed.
+    """
+    last = uri.rstrip("/").rsplit("/", 1)[-1]
+    if re.fullmatch(r"[A-Za-z0-9_-]{24,}", last):
+        return last
+    return hashlib.sha256(uri.encode()).hexdigest()
+
+
+def object_path(cache_dir: str,
+                uri: str) -> str:
+    """Parquet file of a cached data object."""
+    return os.path.join(cache_dir, "objects", f"{object_key(uri)}.parquet")
+
+
+def load_object(cache_dir: str,
+                uri: str) -> pd.DataFrame | None:
+    """Cached table of a data object, None if not cached."""
+    path = object_path(cache_dir, uri)
+    if not os.path.isfile(path):
+        return None
+    return pd.read_parquet(path)
+
+
+def store_object(cache_dir: str,
+                 uri: str,
+                 df: pd.DataFrame) -> None:
+    """Cache the table of a data object, written atomically."""
+    path = object_path(cache_dir, uri)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write(path, lambda tmp: df.to_parquet(tmp, index=False))
+
+
+def fetch_objects(uris: list[str],
+                  cache_dir: str,
+                  loader: Callable[[str], pd.DataFrame] = icos_loader,
+                  workers: int = 4) -> list[pd.DataFrame]:
+    """
+    Tables of several data objects, from the cache or downloaded.
+
+    Data objects are immutable per URI, so a cached table never needs to
+    be refreshed. Uncached objects are downloaded concurrently in a thread
+    pool and added to the cache.
+
+    Args:
+        uris (list[str]): data object URIs
+        cache_dir (str): cache directory
+        loader (Callable[[str], pd.DataFrame]): downloads one object, replaceable for tests
+        workers (int): number of concurrent downloads
+
+    Returns:
+        list[pd.DataFrame]: one table per URI, in the given order
+    """
+    tables = {uri: load_object(cache_dir, uri) for uri in uris}
+    missing = [uri for uri, df in tables.items() if df is None]
+
+    def download(uri: str) -> pd.DataFrame:
+        df = loader(uri)
+        store_object(cache_dir, uri, df)
+        return df
+
+    if missing:
+        print(f"Downloading {len(missing)} of {len(uris)} data object(s).")
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as pool:
+            for uri, df in zip(missing, pool.map(download, missing)):
+                tables[uri] = df
+
+    return [tables[uri] for uri in uris]
+
+
+def index_path(cache_dir: str,
+               station_id: str) -> str:
+    """File with the resolved data objects of a station."""
+    return os.path.join(cache_dir, f"station_{station_id}.json")
+
+
+def load_index(cache_dir: str,
+               station_id: str,
+               datasets: list[str]) -> list[tuple[str, str]] | None:
+    """Cached (uri, dataset name) pairs of a station, None if missing or for other datasets."""
+    path = index_path(cache_dir, station_id)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        index = json.load(f)
+    if index.get("datasets") != list(datasets):
+        return None
+    return [tuple(o) for o in index["objects"]]
+
+
+def store_index(cache_dir: str,
+                station_id: str,
+                datasets: list[str],
+                objects: list[tuple[str, str]]) -> None:
+    """Cache the resolved data objects of a station."""
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(index_path(cache_dir, station_id), "w") as f:
+        json.dump({"datasets": list(datasets), "objects": [list(o) for o in objects]}, f, indent=1)
@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+def index_by_time(df: pd.DataFrame,
+                  time_col: str = "TIMESTAMP") -> pd.DataFrame:
+    """
+    Parse the time column once and use it as a sorted DatetimeIndex.
+
+    Repeated time stamps keep their first row, so frames can be aligned
+    on the index.
+    """
+    df = df.set_index(pd.DatetimeIndex(pd.to_datetime(df[time_col]), name=time_col))
+    df = df.drop(columns=time_col)
+    df = df[~df.index.duplicated(keep="first")]
+    return df if df.index.is_monotonic_increasing else df.sort_index()
+
+
+def merge_tables(dfs: list[pd.DataFrame],
+                 names: list[str],
+                 time_col: str = "TIMESTAMP") -> pd.DataFrame:
+    """
+    Outer-join several time series tables on their time stamps in one step.
+
+    Column names follow the previous pairwise merges: a column of the k-th
+    table (k > 0) that already exists in the tables before it gets the
+    suffix "_<name of table k>".
+
+    Args:
+        dfs (list[pd.DataFrame]): tables with a time column
+        names (list[str]): dataset name per table, used for suffixes
+        time_col (str): name of the time column
+
+    Returns:
+        pd.DataFrame: joined table with a sorted DatetimeIndex
+    """
+    if len(dfs) == 0:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name=time_col))
+
+    frames = []
+    seen = set()
+
+    for k, (df, name) in enumerate(zip(dfs, names)):
+        df = index_by_time(df, time_col)
+        if k > 0:
+            df = df.rename(columns={c: f"{c}_{name}" for c in df.columns if c in seen})
+        seen.update(df.columns)
+        frames.append(df)
+
+    if len(frames) == 1:
+        return frames[0]
+
+    merged = pd.concat(frames, axis=1, join="outer", sort=True)
+    merged.index.name = time_col
+    return merged
+
+
+def binary_path(csv_path: str) -> str:
+    """Parquet file stored next to a merged CSV."""
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def write_merged(df: pd.DataFrame,
+                 csv_path: str) -> None:
+    """Write a merged table as CSV and, if pyarrow is available, as Parquet."""
+    df.to_csv(csv_path)
+    try:
+        df.to_parquet(binary_path(csv_path))
+    except ImportError:
+        pass
+
+
+def read_merged(csv_path: str,
+                time_col: str = "TIMESTAMP",
+                time_format: str = "%Y-%m-%d %H:%M:%S",
+                na_values: list[str] = ["-9999", "-9999.0"]) -> pd.DataFrame:
+    """
+    Read a merged table, from the Parquet copy if it is up to date.
+
+    Args:
+        csv_path (str): merged CSV
+        time_col (str): name of the time column
+        time_format (str): time format in the CSV
+        na_values (list[str]): values marking missing data
+
+    Returns:
+        pd.DataFrame: table with a sorted DatetimeIndex, missing data as NaN
+    """
+    pq_path = binary_path(csv_path)
+
+    if os.path.isfile(pq_path) and (not os.path.isfile(csv_path) or
+                                    os.path.getmtime(pq_path) >= os.path.getmtime(csv_path)):
+        try:
+            df = pd.read_parquet(pq_path)
+            numeric = df.select_dtypes("number").columns
+            missing = np.array([float(v) for v in na_values])
+            df[numeric] = df[numeric].mask(df[numeric].isin(missing))
+            return df if df.index.is_monotonic_increasing else df.sort_index()
+        except ImportError:
+            pass
+
+    df = pd.read_csv(csv_path, na_values=na_values)
+    df[time_col] = pd.to_datetime(df[time_col], format=time_format)
+    df.set_index(time_col, inplace=True)
+    return df if df.index.is_monotonic_increasing else df.sort_index()
@@ -1,36 +1,50 @@
 import os
+import sys
+from collections.abc import Callable
 from functools import reduce
 import yaml
 
 import pandas as pd
 import numpy as np
 
-from icoscp_core.icos import bootstrap
-from icoscp.dobj import Dobj
-from icoscp import cpauth
+from icos_cache import icos_loader, fetch_objects, load_index, store_index
+from icos_merge import merge_tables, write_merged
+
+try:
+    from stage_log import StageLog
+except ImportError:
+    # run directly from its directory, stage_log.py is in src/
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from stage_log import StageLog
 
 outdir: str = "out/csv/"
+cache_dir: str = "out/cache/"
+workers: int = 4
 
 
-if __name__ == "__main__":
+def resolve_objects(station_id: str,
+                    datasets: list[str],
+                    cookie_token: str) -> list[tuple[str, str]]:
     
-    config = yaml.safe_load(open("config_ICOS.yaml"))
-
-    if not isinstance(config, dict): 
-        raise ValueError("Configuration file is empty or not found.")
+    """
+    Find the data objects of a station on the ICOS carbon portal.
     
-    os.makedirs(outdir, exist_ok=True)
-
-    cookie_token = config["auth"]["token"]
+    Args:
+        station_id (str): ICOS station id, e.g. FR-Aur
+        datasets (list[str]): data type labels to look for
+        cookie_token (str): ICOS carbon portal cookie token
+        
+    Returns:
+        list[tuple[str, str]]: (data object URI, dataset name) per dataset found
+    """
+    
+    from icoscp_core.icos import bootstrap
+    from icoscp import cpauth
     
     meta, data = bootstrap.fromCookieToken(cookie_token)
     
     cpauth.init_by(data.auth)
     
-    station_id = config["station"]["id"]
-    
-    datasets = config["datasets"]
-    
     station_list = [s.uri for s in meta.list_stations() if s.id == station_id]
     
     datasets_found = []
@@ -51,32 +65,89 @@ if __name__ == "__main__":
                                                 datatype=d)[0].uri
                         for d in datasets_found]
     
-    dfs = []
+    return list(zip(station_doj_uris, dataset_found_names))
+
+
+def fetch_station(station_id: str,
+                  datasets: list[str],
+                  cookie_token: str,
+                  outdir: str = outdir,
+                  cache_dir: str = cache_dir,
+                  workers: int = workers,
+                  refresh: bool = False,
+                  resolver: Callable[[str, list[str], str], list[tuple[str, str]]] = resolve_objects,
+                  loader: Callable[[str], pd.DataFrame] = icos_loader,
+                  stage_log: str | None = None,
+                  profile_stages: bool | None = None) -> str:
+    
+    """
+    Download and merge the ICOS data objects of one station.
+    
+    The data objects found for a station and their tables are cached, so
+    a re-run for the same station and datasets works offline.
+    
+    Args:
+        station_id (str): ICOS station id, e.g. FR-Aur
+        datasets (list[str]): data type labels to look for
+        cookie_token (str): ICOS carbon portal cookie token
+        outdir (str): output directory of the merged CSV
+        cache_dir (str): cache directory of data objects
+        workers (int): number of concurrent downloads
+        refresh (bool): look up the data objects of the station again
+        resolver (Callable): finds (URI, dataset name) pairs, replaceable for tests
+        loader (Callable): downloads one data object, replaceable for tests
+        stage_log (str | None): JSON lines file for timing, memory and I/O per stage,
+                                default the STAGE_LOG environment variable
+        profile_stages (bool | None): sample the call stacks of each stage
+        
+    Returns:
+        str: path of the merged CSV
+    """
+    
+    log = StageLog("single_point_from_ICOS", path=stage_log, profile=profile_stages, station=station_id)
     
-    for i, s in enumerate(station_doj_uris):
+    os.makedirs(outdir, exist_ok=True)
+    
+    with log.stage("resolve") as stage:
+        
+        objects = None if refresh else load_index(cache_dir, station_id, datasets)
+        stage["cached"] = objects is not None
         
-        print("Loading data object: ", dataset_found_names[i])
-        dobj = Dobj(s)
-        df = dobj.data
-        print("Data loaded with shape: ", df.shape)
-        dfs.append(df)
+        if objects is None:
+            objects = resolver(station_id, datasets, cookie_token)
+            store_index(cache_dir, station_id, datasets, objects)
+    
+    dataset_found_names = [name for _, name in objects]
+    
+    with log.stage("download", objects=len(objects)):
+        dfs = fetch_objects([uri for uri, _ in objects], cache_dir, loader=loader, workers=workers)
+    
+    for name, df in zip(dataset_found_names, dfs):
+        print("Data loaded: ", name, "with shape: ", df.shape)
 
-    df_all = pd.DataFrame()
+    with log.stage("merge"):
+        df_all = merge_tables(dfs, dataset_found_names, time_col="TIMESTAMP")
+    
+    out_path = f"{outdir}/ICOS_single_point_{station_id}.csv"
+    
+    with log.stage("write", rows=len(df_all)):
+        write_merged(df_all, out_path)
+    
+    return out_path
 
-    for i in range(len(dfs)):
-        
-        if i == 0:
-            
-            df_all = pd.concat([df_all, dfs[i]], ignore_index=True)
-            
-        else:
-    
-            df_all = pd.merge(df_all, 
-                              dfs[i],
-                              how="outer", 
-                              on="TIMESTAMP",
-                              suffixes=(None, '_' + dataset_found_names[i]))
-            
-    df_all = df_all.set_index("TIMESTAMP").sort_index()
-    
-    df_all.to_csv(f"{outdir}/ICOS_single_point_{station_id}.csv")
+
+if __name__ == "__main__":
+    
+    config = yaml.safe_load(open("config_ICOS.yaml"))
+
+    if not isinstance(config, dict): 
+        raise ValueError("Configuration file is empty or not found.")
+    
+    download = config.get("download", {})
+    
+    fetch_station(config["station"]["id"],
+                  config["datasets"],
+                  config["auth"]["token"],
+                  cache_dir=download.get("cache_dir", cache_dir),
+                  workers=download.get("workers", workers),
+                  refresh=download.get("refresh", False))
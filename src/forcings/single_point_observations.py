@@ -1,23 +1,28 @@
 import os
-import datetime
-import pytz
+import sys
 import yaml
 import numpy as np
-import netCDF4 as nc
 import pandas as pd
-from pint import UnitRegistry
 
+from forcing_writer import forcing_spec, write_forcing_file
+from icos_merge import read_merged
+from gapfill import gapfill
+from unit_plan import conversion_factors, apply_conversion
 
-# Settings
-config = yaml.safe_load(open("config_ICOS.yaml"))
+try:
+    from stage_log import StageLog
+except ImportError:
+    # run directly from its directory, stage_log.py is in src/
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from stage_log import StageLog
 
-if not isinstance(config, dict): 
-    raise ValueError("Configuration file is empty or not found.")
 
-station = config["station"]["id"]
+# Settings
+config_file: str = "config_ICOS.yaml"
 
-infile: str = f"out/csv/ICOS_single_point_{station}.csv"
-outdir: str = f"./out/{station}/"
+# {station} is replaced by the station id
+infile: str = "out/csv/ICOS_single_point_{station}.csv"
+outdir: str = "./out/{station}/"
 
 var_names: dict[str, str] = {"PRECTmms": "P", 
                              "PSRF": "PA", 
@@ -60,6 +65,7 @@ start_month: int = 6
 end_month: int = 7
 t_res: str = "1h"
 
+# site coordinates, overridden by lat and lon of the station in config_file
 lon: float = 20.00
 lat: float = 61.85
 
@@ -67,285 +73,275 @@ latlon_buffer: float = 0.01
 
 na_values = ["-9999", "-9999.0"]
 
+# Output: zlib level (0 = uncompressed), time chunk length (None = whole month)
+# and single precision for the time-dependent variables
+complevel: int = 4
+time_chunk: int | None = None
+float32_output: bool = False
+
+# Gap filling: out-of-range values are removed, gaps up to max_interp_gap are
+# interpolated, longer ones filled with the mean diurnal cycle of +- diurnal_window_days
+gapfill_forcing: bool = True
+max_interp_gap: str = "3h"
+diurnal_window_days: int = 7
+
+# Timing, memory and I/O per stage as JSON lines (None: STAGE_LOG environment
+# variable or off), with sampled call stacks per stage if profile_stages
+stage_log: str | None = None
+profile_stages: bool | None = None
+
+
+def build_forcing(data: pd.DataFrame,
+                  var_names: dict[str, str],
+                  scale: np.ndarray,
+                  offset: np.ndarray,
+                  tres: str) -> pd.DataFrame:
+    
+    """
+    Convert units and resample all forcing variables in one pass.
+    
+    Args:
+        data (pd.DataFrame): observations with a sorted DatetimeIndex
+        var_names (dict[str, str]): forcing variable -> observation column
+        scale (np.ndarray): conversion scale per forcing variable
+        offset (np.ndarray): conversion offset per forcing variable
+        tres (str): target time resolution
+        
+    Returns:
+        pd.DataFrame: forcing variables at the target resolution
+    """
+    
+    values = data[list(var_names.values())].to_numpy(dtype=np.float64)
+    
+    # converted in place, a read-only view of data is copied first
+    if not values.flags.writeable:
+        values = values.copy()
+    apply_conversion(values, scale, offset)
+    
+    return pd.DataFrame(values, 
+                        index=data.index, 
+                        columns=list(var_names)).resample(tres).mean()
+
+
+def station_forcing(infile: str,
+                    start_year: int,
+                    start_month: int,
+                    end_year: int,
+                    end_month: int,
+                    t_res: str = t_res,
+                    gapfill_forcing: bool = gapfill_forcing,
+                    var_names: dict[str, str] = var_names,
+                    src_units: dict[str, str] = src_units,
+                    dst_units: dict[str, str] = dst_units,
+                    scaling_factors: dict[str, float] = scaling_factors,
+                    log: StageLog | None = None) -> tuple[pd.DataFrame, pd.DataFrame | None]:
+    
+    """
+    Forcing time series of one station from its observation CSV.
+    
+    Args:
+        infile (str): observation CSV with a TIMESTAMP column
+        start_year (int): first year
+        start_month (int): first month of the first year
+        end_year (int): last year
+        end_month (int): last month of the last year
+        t_res (str): time resolution of the forcing
+        gapfill_forcing (bool): quality control and gap filling
+        var_names (dict[str, str]): forcing variable -> observation column
+        src_units (dict[str, str]): unit of the observations per forcing variable
+        dst_units (dict[str, str]): unit of the forcing per forcing variable
+        scaling_factors (dict[str, float]): additional factor per forcing variable
+        log (StageLog | None): stage log of the run
+        
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame | None]: forcing in output units, gap report if gap filled
+    """
+    
+    log = log or StageLog("single_point_observations", infile=infile)
+    
+    with log.stage("read") as stage:
+        
+        # reading in data, from the binary copy of the CSV if available
+        data = read_merged(infile, time_col=time_col, time_format=time_format, na_values=na_values)
+    
+        # Restrict to the requested period
+        period_start = pd.Timestamp(start_year, start_month, 1)
+        period_end = pd.Timestamp(end_year, end_month, 1) + pd.offsets.MonthBegin(1)
+        data = data[(data.index >= period_start) & (data.index < period_end)]
+        stage["rows"] = len(data)
 
-# Main code, don't change anything below this line unless you know what you're doing
-if __name__ == "__main__":
+    with log.stage("convert"):
+        
+        # Unit conversion of all variables at once, then a single resampling
+        scale, offset = conversion_factors({v: src_units[v] for v in var_names},
+                                           dst_units, scaling_factors)
+        
+        forcing = build_forcing(data, var_names, scale, offset, t_res)
+    
+    report = None
+    
+    if gapfill_forcing:
+        with log.stage("gapfill"):
+            forcing, report = gapfill(forcing, max_interp_gap, diurnal_window_days)
     
-    # Class for unit handling
-    Q_ = UnitRegistry().Quantity
+    return forcing, report
+
+
+def write_monthly_files(forcing: pd.DataFrame,
+                        outdir: str,
+                        lat: float,
+                        lon: float,
+                        units: dict[str, str],
+                        latlon_buffer: float = latlon_buffer,
+                        complevel: int = complevel,
+                        time_chunk: int | None = time_chunk,
+                        float32_output: bool = float32_output) -> list[str]:
+    
+    """
+    Write forcing time series as monthly eCLM forcing files <outdir>/YYYY-MM.nc.
+    
+    Args:
+        forcing (pd.DataFrame): forcing on a DatetimeIndex, one column per variable
+        outdir (str): output directory
+        lat (float): site latitude
+        lon (float): site longitude
+        units (dict[str, str]): unit per forcing variable
+        latlon_buffer (float): half size of the site grid cell in degrees
+        complevel (int): zlib compression level, 0 for uncompressed
+        time_chunk (int | None): chunk length along time, whole month if None
+        float32_output (bool): write the forcing variables in single precision
+        
+    Returns:
+        list[str]: written files
+    """
     
     # Handle negative latitudes
     lonbuffer = latlon_buffer
     latbuffer = latlon_buffer if lat >= 0 else -latlon_buffer
-
-    # reading in data
-    data = pd.read_csv(infile, na_values=na_values)
-
-    # Convert 'TIMESTAMP_START' to datetime format and set as index
-    data[time_col] = pd.to_datetime(data[time_col], format=time_format)
-    data.set_index(time_col, inplace=True)
-
-    site_dates = data.index.to_series(name="time")#.apply(lambda x: x.tz_localize(pytz.utc))
-    years = np.arange(start_year, end_year + 1)
-    t_per_h = site_dates.resample(t_res).mean().count() / site_dates.resample("1h").mean().count()
-
-    # Collect all the data
-    prec_vals  = data[var_names["PRECTmms"]].to_numpy()
-    prs_vals   = data[var_names["PSRF"]].to_numpy()
-    fsds_vals  = data[var_names["FSDS"]].to_numpy()
-    flds_vals  = data[var_names["FLDS"]].to_numpy()
-    q_vals     = data[var_names["RH"]].to_numpy()
-    temp_vals  = data[var_names["TBOT"]].to_numpy()
-    wind_vals  = data[var_names["WIND"]].to_numpy()
-
-    # Iterate through years and months to create separate files:
-    for y in years:
+    
+    os.makedirs(outdir, exist_ok=True)
+    
+    spec = forcing_spec({v: units[v] for v in forcing.columns},
+                        dtype="float32" if float32_output else "float64")
+    
+    written = []
+    
+    # One file per month
+    for (y, m), month in forcing.groupby([forcing.index.year, forcing.index.month]):
         
-        if (y == start_year) and (y != end_year):
-            months = np.arange(start_month, 12 + 1)
-        elif (y == end_year) and (y != start_year):
-            months = np.arange(1, end_month + 1)
-        elif (y == start_year) and (y == end_year):
-            months = np.arange(start_month, end_month + 1)
-        else:
-            months = np.arange(1, 12 + 1)
+        dst_name = os.path.join(outdir, f"{y:04d}-{m:02d}.nc")
+        written.append(dst_name)
+    
+        # time hours since beginning of file
+        time_forc = ((month.index - pd.Timestamp(y, m, 1)) / pd.Timedelta("1h")).to_numpy(dtype=np.float32)
         
-        for m in months:
-            
-            os.makedirs(outdir, exist_ok=True)
-            dst_name = os.path.join(outdir, f"{y:04d}-{m:02d}.nc")
+        write_forcing_file(dst_name,
+                           spec,
+                           month.to_numpy(),
+                           time_forc,
+                           f"hours since {y:04d}-{m:02d}-01 00:00:00",
+                           lat, lon,
+                           latbuffer, lonbuffer,
+                           complevel=complevel,
+                           time_chunk=time_chunk)
+    
+    return written
+
+
+def write_forcing(infile: str,
+                  outdir: str,
+                  lat: float,
+                  lon: float,
+                  start_year: int,
+                  start_month: int,
+                  end_year: int,
+                  end_month: int,
+                  t_res: str = t_res,
+                  latlon_buffer: float = latlon_buffer,
+                  complevel: int = complevel,
+                  time_chunk: int | None = time_chunk,
+                  float32_output: bool = float32_output,
+                  gapfill_forcing: bool = gapfill_forcing,
+                  var_names: dict[str, str] = var_names,
+                  src_units: dict[str, str] = src_units,
+                  dst_units: dict[str, str] = dst_units,
+                  scaling_factors: dict[str, float] = scaling_factors,
+                  stage_log: str | None = stage_log,
+                  profile_stages: bool | None = profile_stages) -> list[str]:
+    
+    """
+    Create monthly single-point forcing files from a station observation CSV.
+    
+    Args:
+        infile (str): observation CSV with a TIMESTAMP column
+        outdir (str): output directory
+        lat (float): site latitude
+        lon (float): site longitude
+        start_year (int): first year
+        start_month (int): first month of the first year
+        end_year (int): last year
+        end_month (int): last month of the last year
+        t_res (str): time resolution of the forcing
+        latlon_buffer (float): half size of the site grid cell in degrees
+        complevel (int): zlib compression level, 0 for uncompressed
+        time_chunk (int | None): chunk length along time, whole month if None
+        float32_output (bool): write the forcing variables in single precision
+        gapfill_forcing (bool): quality control and gap filling before writing,
+                                with a gap report written to outdir
+        var_names (dict[str, str]): forcing variable -> observation column
+        src_units (dict[str, str]): unit of the observations per forcing variable
+        dst_units (dict[str, str]): unit of the forcing per forcing variable
+        scaling_factors (dict[str, float]): additional factor per forcing variable
+        stage_log (str | None): JSON lines file for timing, memory and I/O per stage
+        profile_stages (bool | None): sample the call stacks of each stage
         
-            dst = nc.Dataset(dst_name, "w")
-
-            indices = np.argwhere((site_dates.dt.year == y) & (site_dates.dt.month == m)).flatten()
-            
-            def process_var(array: np.ndarray, 
-                            src_unit: str,
-                            dst_unit: str,
-                            unit_factor: float,
-                            tindex: pd.Series,
-                            tres: str,
-                            dtype: str = "float64") -> np.ndarray:
-                
-                """Process variable: unit conversion, scaling, resampling."""
-                
-                # Unit conversion and scaling
-                unit_quantity = Q_(array, src_unit)
-                convert_unit = unit_quantity.to(dst_unit).magnitude
-                scaled_var = convert_unit * unit_factor
-                
-                # Temporal resampling
-                series = pd.Series(scaled_var, index=tindex)
-                resampled = series.resample(tres).mean().to_numpy().astype(dtype)
-                
-                return resampled
-
-            # PRECT
-            precip_forc = process_var(prec_vals[indices], 
-                                      src_units["PRECTmms"],
-                                      dst_units["PRECTmms"],
-                                      scaling_factors["PRECTmms"],
-                                      site_dates.iloc[indices],
-                                      t_res)
-
-            # PSRF
-            prs_forc = process_var(prs_vals[indices], 
-                                  src_units["PSRF"],
-                                  dst_units["PSRF"],
-                                  scaling_factors["PSRF"],
-                                  site_dates.iloc[indices],
-                                  t_res)
-
-            # FSDS
-            fsds_forc = process_var(fsds_vals[indices], 
-                                   src_units["FSDS"],
-                                   dst_units["FSDS"],
-                                   scaling_factors["FSDS"],
-                                   site_dates.iloc[indices],
-                                   t_res)
-
-            # FLDS
-            flds_forc = process_var(flds_vals[indices], 
-                                   src_units["FLDS"],
-                                   dst_units["FLDS"],
-                                   scaling_factors["FLDS"],
-                                   site_dates.iloc[indices],
-                                   t_res)
-
-            # RH
-            q_forc = process_var(q_vals[indices], 
-                                src_units["RH"],
-                                dst_units["RH"],
-                                scaling_factors["RH"],
-                                site_dates.iloc[indices],
-                                t_res)
-            # TBOT
-            temp_forc = process_var(temp_vals[indices], 
-                                   src_units["TBOT"],
-                                   dst_units["TBOT"],
-                                   scaling_factors["TBOT"],
-                                   site_dates.iloc[indices],
-                                   t_res)
-            # WIND
-            wind_forc = process_var(wind_vals[indices], 
-                                   src_units["WIND"],
-                                   dst_units["WIND"],
-                                   scaling_factors["WIND"],
-                                   site_dates.iloc[indices],
-                                   t_res)
-            
-            # time hours since beginning of file
-            time_forc = np.linspace(0, 
-                                   (indices[-1] - indices[0]) * t_per_h, 
-                                   indices[-1] - indices[-0], 
-                                   dtype=np.float32)
-
-            # dimensions
-            dst.createDimension("scalar", 1)
-            dst.createDimension("lon", 1)
-            dst.createDimension("lat", 1)
-            dst.createDimension("time", None) 
-
-
-            # Attributes
-            dst.setncattr("Forcings_generated_by", "Fernand Eloundou")
-            dst.setncattr("on_date", datetime.datetime.today().strftime("%Y%m%d%H%M"))
-            dst.setncattr("based_on", "data from ICOS portal") 
-            dst.setncattr("used_for", "Singlepoint CLM 5.0")
-            
-
-            time = dst.createVariable("time", datatype=np.float32, dimensions=("time",))
-            time.setncatts({"long_name": "observation time",
-                            "units": f"hours since {y:04d}-{m:02d}-01 00:00:00", 
-                            "calendar": "gregorian", 
-                            "axis": "T"})
-            
-            # Time for 3-hour intervals
-            dst.variables["time"][:] = time_forc[:]
-
-            longxy = dst.createVariable("LONGXY", datatype=np.float32, dimensions=("lat", "lon"), 
-                                        fill_value=np.float32(np.nan))
-            longxy.setncatts({"long_name": "longitude", "units": "degrees E", "mode": "time-invariant"})     
-            dst.variables["LONGXY"][:, :] = lon
-
-            latixy = dst.createVariable("LATIXY", datatype=np.float32, dimensions=("lat", "lon"), 
-                                        fill_value=np.float32(np.nan))
-            latixy.setncatts({"long_name": "latitude", "units": "degrees N", "mode": "time-invariant"})            
-            dst.variables["LATIXY"][:, :] = lat
-
-            lone = dst.createVariable("LONE", datatype=np.float32, dimensions=("lat", "lon"), 
-                                      fill_value=np.float32(np.nan))
-            lone.setncatts({"long_name": "longitude of east edge", "units": "degrees E", "mode": "time-invariant"})            
-            dst.variables["LONE"][:, :] = lon + lonbuffer
-
-            latn = dst.createVariable("LATN", datatype=np.float32, dimensions=("lat", "lon"), 
-                                      fill_value=np.float32(np.nan))
-            latn.setncatts({"long_name": "latitude of north edge", "units": "degrees N", "mode": "time-invariant"})            
-            dst.variables["LATN"][:, :] = lat + latbuffer
-
-            lonw = dst.createVariable("LONW", datatype=np.float32, dimensions=("lat", "lon"), 
-                                      fill_value=np.float32(np.nan))
-            lonw.setncatts({"long_name": "longitude of west edge", "units": "degrees E", "mode": "time-invariant"})            
-            dst.variables["LONW"][:, :] = lon - lonbuffer
-
-            lats = dst.createVariable("LATS", datatype=np.float32, dimensions=("lat", "lon"), 
-                                            fill_value=np.float32(np.nan))
-            lats.setncatts({"long_name": "latitude of south edge", "units": "degrees N", "mode": "time-invariant"})            
-            dst.variables["LATS"][:, :] = lat - latbuffer
-
-            prectmms = dst.createVariable("PRECTmms", datatype=np.float64,
-                                          dimensions=("time", "lat", "lon",), 
-                                          fill_value=np.float64(np.nan))
-            prectmms.setncatts({"long_name": "Precipitation",
-                                "units": dst_units["PRECTmms"], 
-                                "missing_value": np.float64(np.nan),
-                                "mode": "time-dependent"})
-            
-            dst.variables["PRECTmms"][:, :, :] = precip_forc[:]
-
-            psrf = dst.createVariable("PSRF", datatype=np.float64,
-                                      dimensions=("time", "lat", "lon",), 
-                                      fill_value=np.float64(np.nan))
-            psrf.setncatts({"long_name": "surface pressure at the lowest atm level (2m above ground)", 
-                            "units": dst_units["PSRF"], 
-                            "missing_value": np.float64(np.nan), 
-                            "mode": "time-dependent"})
-            dst.variables["PSRF"][:, :, :] = prs_forc[:]
-
-            fsds = dst.createVariable("FSDS", datatype=np.float64,
-                                      dimensions=("time", "lat", "lon",), 
-                                      fill_value=np.float64(np.nan))
-            fsds.setncatts({"long_name": "Downward shortwave radiation", 
-                            "missing_value": np.float64(np.nan), 
-                            "units": dst_units["FSDS"], 
-                            "mode": "time-dependent"})
-            
-            dst.variables["FSDS"][:, :, :] = fsds_forc[:]
-
-            flds = dst.createVariable("FLDS", datatype=np.float64,
-                                      dimensions=("time", "lat", "lon",), 
-                                      fill_value=np.float64(np.nan))
-            flds.setncatts({"long_name": "Downward longwave radiation", 
-                            "missing_value": np.float64(np.nan), 
-                            "units": dst_units["FLDS"], 
-                            "mode": "time-dependent"})
-            
-            dst.variables["FLDS"][:, :, :] = flds_forc[:]
-
-            rh = dst.createVariable("RH", datatype=np.float64,
-                                        dimensions=("time", "lat", "lon",), 
-                                        fill_value=np.float64(np.nan))
-            rh.setncatts({"long_name": "relative humidity at the lowest atm level (2m above ground)", 
-                          "units": dst_units["RH"], 
-                          "missing_value": np.float64(np.nan), 
-                          "mode": "time-dependent"})
-            
-            dst.variables["RH"][:, :, :] = q_forc[:]
-
-            tbot = dst.createVariable("TBOT", datatype=np.float64,
-                                      dimensions=("time", "lat", "lon",), 
-                                      fill_value=np.float64(np.nan))
-            tbot.setncatts({"long_name": "temperature at the lowest atm level (2m above ground)", 
-                            "units": dst_units["TBOT"], 
-                            "missing_value": np.float64(np.nan), 
-                            "mode": "time-dependent"})
-            
-            dst.variables["TBOT"][:, : , :] = temp_forc[:]
+    Returns:
+        list[str]: written files
+    """
+    
+    log = StageLog("single_point_observations", path=stage_log, profile=profile_stages, infile=infile)
+    
+    forcing, report = station_forcing(infile,
+                                      start_year, start_month,
+                                      end_year, end_month,
+                                      t_res=t_res,
+                                      gapfill_forcing=gapfill_forcing,
+                                      var_names=var_names,
+                                      src_units=src_units,
+                                      dst_units=dst_units,
+                                      scaling_factors=scaling_factors,
+                                      log=log)
+    
+    os.makedirs(outdir, exist_ok=True)
+    
+    if report is not None:
+        report.to_csv(os.path.join(outdir, "gap_report.csv"))
+    
+    with log.stage("write") as stage:
+        
+        written = write_monthly_files(forcing, outdir, lat, lon, dst_units,
+                                      latlon_buffer=latlon_buffer,
+                                      complevel=complevel,
+                                      time_chunk=time_chunk,
+                                      float32_output=float32_output)
+        
+        stage["files"] = len(written)
+    
+    return written
 
-            wind = dst.createVariable("WIND", datatype=np.float64,
-                                      dimensions=("time", "lat", "lon",), 
-                                      fill_value=np.float64(np.nan))
-            
-            wind.setncatts({"long_name": "wind at the lowest atm level (2m above ground)", 
-                            "units": dst_units["WIND"], 
-                            "missing_value": np.float64(np.nan), 
-                            "mode": "time-dependent"})
-            
-            dst.variables["WIND"][:, :, :] = wind_forc[:]
 
+# Main code, don't change anything below this line unless you know what you're doing
+if __name__ == "__main__":
+    
+    config = yaml.safe_load(open(config_file))
 
-            edgen = dst.createVariable("EDGEN", np.float32, ("scalar",))
-            edgen.setncatts({"long_name": "northern edge in atmospheric data", 
-                             "units": "degrees N", 
-                             "mode":"time-invariant"})
-            
-            edgee = dst.createVariable("EDGEE", np.float32, ("scalar",))
-            edgee.setncatts({"long_name": "eastern edge in atmospheric data", 
-                             "units": "degrees E", 
-                             "mode": "time-invariant"})
-            
-            edges = dst.createVariable("EDGES", np.float32, ("scalar",))
-            edges.setncatts({"long_name": "southern edge in atmospheric data", 
-                             "units": "degrees N", 
-                             "mode": "time-invariant"})
-            
-            edgew = dst.createVariable("EDGEW", np.float32, ("scalar",))
-            edgew.setncatts({"long_name": "western edge in atmospheric data", 
-                             "units": "degrees E", 
-                             "mode": "time-invariant"})
+    if not isinstance(config, dict): 
+        raise ValueError("Configuration file is empty or not found.")
 
-            # location for site
-            dst.variables["EDGEN"][:] = lat
-            dst.variables["EDGES"][:] = lat
-            dst.variables["EDGEE"][:] = lon
-            dst.variables["EDGEW"][:] = lon
\ No newline at end of file
+    station = config["station"]["id"]
+    
+    write_forcing(infile.format(station=station),
+                  outdir.format(station=station),
+                  config["station"].get("lat", lat), config["station"].get("lon", lon),
+                  start_year, start_month,
+                  end_year, end_month)
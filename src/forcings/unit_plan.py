@@ -0,0 +1,147 @@
+"""
+Unit conversion plans: each (source unit, destination unit, scaling factor)
+is resolved once with pint into an affine transform y = scale * x + offset,
+which is then applied in place to plain NumPy arrays.
+
+Run as a script to check the plans of single_point_observations.py against
+the conversion with pint Quantities and to time both.
+"""
+import time
+from functools import lru_cache
+import numpy as np
+
+
+@lru_cache(maxsize=None)
+def unit_registry():
+    """
+    pint unit registry, created once per process.
+
+    pint is imported here so that importing this module stays cheap.
+    """
+    from pint import UnitRegistry
+    return UnitRegistry()
+
+
+@lru_cache(maxsize=None)
+def conversion_plan(src_unit: str,
+                    dst_unit: str,
+                    scaling_factor: float = 1.0) -> tuple[float, float]:
+    """
+    Affine transform of a unit conversion followed by a scaling.
+
+    The scale is taken from the conversion of a unit difference, which pint
+    resolves without cancellation also for offset units like °C or degF.
+
+    Args:
+        src_unit (str): source unit
+        dst_unit (str): destination unit
+        scaling_factor (float): additional factor applied after the conversion
+
+    Returns:
+        tuple[float, float]: scale and offset
+    """
+    Q_ = unit_registry().Quantity
+
+    offset = Q_(0.0, src_unit).to(dst_unit).magnitude
+    delta = Q_(1.0, src_unit) - Q_(0.0, src_unit)
+    scale = delta.to((Q_(1.0, dst_unit) - Q_(0.0, dst_unit)).units).magnitude
+
+    return float(scale * scaling_factor), float(offset * scaling_factor)
+
+
+def conversion_factors(src_units: dict[str, str],
+                       dst_units: dict[str, str],
+                       scaling_factors: dict[str, float]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Affine unit conversion per variable, see conversion_plan.
+
+    Args:
+        src_units (dict[str, str]): source unit per variable
+        dst_units (dict[str, str]): destination unit per variable
+        scaling_factors (dict[str, float]): additional factor per variable
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: scale and offset per variable, in the order of src_units
+    """
+    plans = [conversion_plan(src_units[v], dst_units[v], float(scaling_factors[v])) for v in src_units]
+    return np.array([p[0] for p in plans]), np.array([p[1] for p in plans])
+
+
+def apply_conversion(values: np.ndarray,
+                     scale: np.ndarray,
+                     offset: np.ndarray) -> np.ndarray:
+    """
+    Convert values (time, n_variables) in place.
+
+    Returns:
+        np.ndarray: values, the same array
+    """
+    values *= scale
+    values += offset
+    return values
+
+
+def pint_conversion(values: np.ndarray,
+                    src_units: dict[str, str],
+                    dst_units: dict[str, str],
+                    scaling_factors: dict[str, float]) -> np.ndarray:
+    """Reference conversion with one pint Quantity per variable."""
+    Q_ = unit_registry().Quantity
+    return np.column_stack([Q_(values[:, k], src_units[v]).to(dst_units[v]).magnitude * scaling_factors[v]
+                            for k, v in enumerate(src_units)])
+
+
+def ulp_difference(a: np.ndarray,
+                   b: np.ndarray) -> np.ndarray:
+    """Largest difference per column in units of the last place of b."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.nanmax(np.abs(a - b) / np.spacing(np.abs(b)), axis=0)
+
+
+def verify_plans(src_units: dict[str, str],
+                 dst_units: dict[str, str],
+                 scaling_factors: dict[str, float],
+                 n: int = 100000,
+                 seed: int = 0) -> dict[str, float]:
+    """
+    Compare the conversion plans with pint on random values.
+
+    Returns:
+        dict[str, float]: largest difference per variable in units of the last place, 0 if identical
+    """
+    values = np.random.default_rng(seed).normal(0.0, 100.0, (n, len(src_units)))
+
+    reference = pint_conversion(values, src_units, dst_units, scaling_factors)
+    converted = apply_conversion(values.copy(), *conversion_factors(src_units, dst_units, scaling_factors))
+
+    return dict(zip(src_units, ulp_difference(converted, reference).tolist()))
+
+
+if __name__ == "__main__":
+
+    from single_point_observations import var_names, src_units, dst_units, scaling_factors
+
+    src = {v: src_units[v] for v in var_names}
+
+    ulps = verify_plans(src, dst_units, scaling_factors)
+    for v, u in ulps.items():
+        print(f"{v:10s} {src[v]:>6s} -> {dst_units[v]:6s} max difference {u:g} ulp")
+
+    # half-hourly record of 20 years, converted month by month
+    values = np.random.default_rng(1).normal(0.0, 100.0, (48 * 365 * 20, len(src)))
+    months = np.array_split(values, 240)
+
+    t0 = time.perf_counter()
+    for m in months:
+        pint_conversion(m, src, dst_units, scaling_factors)
+    t_pint = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for m in months:
+        apply_conversion(m, *conversion_factors(src, dst_units, scaling_factors))
+    t_plan = time.perf_counter() - t0
+
+    print(f"pint Quantities {t_pint:.3f} s, conversion plans {t_plan:.3f} s for {len(months)} months")
+
+    if any(u > 0 for u in ulps.values()):
+        raise SystemExit("Conversion plans differ from pint.")
@@ -0,0 +1,304 @@
+import os
+import time
+import yaml
+import numpy as np
+import netCDF4 as nc
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+config_file: str = "config_adjust_pft.yaml"
+
+# Landunit fractions of the surface data, in percent of the grid cell
+landunit_vars: list[str] = ["PCT_NATVEG", "PCT_CROP", "PCT_URBAN", "PCT_LAKE", "PCT_WETLAND", "PCT_GLACIER"]
+
+# Landunits that absorb the difference when the fractions do not add up to 100
+adjustable_landunits: list[str] = ["PCT_NATVEG", "PCT_CROP"]
+
+
+def renormalize(pct: np.ndarray,
+                axis: int = 0) -> np.ndarray:
+    """
+    Rescale percentages to add up to 100 along an axis.
+
+    Cells where all values are zero are left unchanged.
+
+    Args:
+        pct (np.ndarray): percentages, e.g. (pft, lat, lon)
+        axis (int): axis to normalise over
+
+    Returns:
+        np.ndarray: renormalised percentages
+    """
+    total = pct.sum(axis=axis, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0, pct * (100.0 / total), pct)
+
+
+def pft_numbers(ds: nc.Dataset,
+                name: str) -> np.ndarray:
+    """
+    CLM PFT numbers along the first dimension of a PFT variable.
+
+    Taken from the coordinate variable of the dimension, natpft (0-14) or
+    cft (15-78) in CLM5 surface data, and counted from 0 if there is none.
+    """
+    dim = ds.variables[name].dimensions[0]
+    if dim in ds.variables:
+        return np.asarray(ds.variables[dim][:]).astype(int)
+    return np.arange(ds.dimensions[dim].size)
+
+
+def target_weights(spec: dict[int, float],
+                   pfts: np.ndarray,
+                   mode: str) -> np.ndarray:
+    """
+    Weights along the PFT dimension from a {CLM PFT number: value} mapping.
+
+    In "replace" mode missing PFTs get 0, in "scale" mode a factor of 1.
+
+    Args:
+        spec (dict[int, float]): value per CLM PFT number
+        pfts (np.ndarray): PFT numbers of the dimension, see pft_numbers
+        mode (str): "replace" or "scale"
+
+    Returns:
+        np.ndarray: weights (pft,)
+    """
+    unknown = sorted(int(k) for k in spec if int(k) not in pfts)
+    if unknown:
+        raise ValueError(f"PFT(s) {unknown} not in the file, available are {pfts.min()} to {pfts.max()}.")
+
+    position = {p: k for k, p in enumerate(pfts.tolist())}
+    w = np.zeros(len(pfts)) if mode == "replace" else np.ones(len(pfts))
+    for k, v in spec.items():
+        w[position[int(k)]] = v
+    return w
+
+
+def apply_ratios(pct: np.ndarray,
+                 target: np.ndarray,
+                 mode: str) -> np.ndarray:
+    """
+    Apply target PFT ratios to a block of grid cells.
+
+    Cells with masked weights are left unchanged.
+
+    Args:
+        pct (np.ndarray): current percentages (pft, lat, lon)
+        target (np.ndarray): weights (pft,) for all cells or (pft, lat, lon) per cell,
+                             may be a masked array
+        mode (str): "replace" sets the ratios to the weights,
+                    "scale" multiplies the current ratios by the weights
+
+    Returns:
+        np.ndarray: renormalised percentages (pft, lat, lon)
+    """
+    masked = np.ma.getmaskarray(target)
+    target = np.ma.filled(np.ma.asarray(target, dtype=np.float64), 0.0)
+    if target.ndim == 1:
+        target = target[:, np.newaxis, np.newaxis]
+        masked = masked[:, np.newaxis, np.newaxis]
+
+    if mode == "replace":
+        new = np.broadcast_to(target, pct.shape)
+    elif mode == "scale":
+        new = pct * target
+    else:
+        raise ValueError(f"Unknown mode '{mode}', use 'replace' or 'scale'.")
+
+    return np.where(masked.any(axis=0), pct, renormalize(new, axis=0))
+
+
+def landunit_fractions(lu: dict[str, np.ndarray],
+                       targets: dict[str, float],
+                       tol: float = 1e-6) -> dict[str, np.ndarray]:
+    """
+    New landunit fractions of a block of grid cells, adding up to 100 %.
+
+    Targeted landunits are set to their value, for PCT_URBAN the sum over
+    the density classes. The other landunits are rescaled: natural vegetation
+    and crop absorb the difference, and if that is not enough all landunits
+    without a target are scaled together.
+
+    Args:
+        lu (dict[str, np.ndarray]): current percent per landunit variable, (lat, lon) or (class, lat, lon)
+        targets (dict[str, float]): percent per landunit variable, e.g. {"PCT_CROP": 20}
+
+    Returns:
+        dict[str, np.ndarray]: new percent per landunit variable
+
+    Raises:
+        ValueError: if the targets exceed 100 % or the other landunits cannot fill the cell
+    """
+    unknown = [v for v in targets if v not in lu]
+    if unknown:
+        raise ValueError(f"Landunit(s) {unknown} not in the file, available are {list(lu)}.")
+
+    room = 100.0 - sum(targets.values())
+    if room < -tol:
+        raise ValueError(f"Landunit targets add up to {100.0 - room:g} %, more than 100 %.")
+
+    # urban has a density class dimension
+    def cell_sum(names: list[str]) -> np.ndarray:
+        return sum((lu[v].sum(axis=0) if lu[v].ndim == 3 else lu[v] for v in names),
+                   np.zeros(next(iter(lu.values())).shape[-2:]))
+
+    new = dict(lu)
+    for v, value in targets.items():
+        if lu[v].ndim == 3:
+            # keep the split over the density classes, equal where there is none
+            total = lu[v].sum(axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                share = np.where(total > 0, lu[v] / total, 1.0 / lu[v].shape[0])
+            new[v] = share * value
+        else:
+            new[v] = np.full_like(lu[v], value)
+
+    free = [v for v in adjustable_landunits if v in lu and v not in targets]
+    others = [v for v in lu if v not in targets and v not in free]
+
+    free_total = cell_sum(free)
+    free_room = room - cell_sum(others)
+    rest_total = free_total + cell_sum(others)
+
+    # natural vegetation and crop absorb the difference where they can
+    by_free = (free_room >= -tol) & ((free_total > 0) | (np.abs(free_room) <= tol))
+    if not np.all(by_free | (rest_total > 0) | (room <= tol)):
+        raise ValueError(f"Landunits without a target are zero in some cells, "
+                         f"they cannot fill the {room:g} % left by the targets.")
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        factor_free = np.where(by_free, np.where(free_total > 0, np.maximum(free_room, 0.0) / free_total, 0.0),
+                               np.where(rest_total > 0, room / rest_total, 0.0))
+        factor_others = np.where(by_free, 1.0, np.where(rest_total > 0, room / rest_total, 0.0))
+
+    for v in free:
+        new[v] = lu[v] * factor_free
+    for v in others:
+        new[v] = lu[v] * factor_others
+
+    return new
+
+
+def adjust_landunits(ds: nc.Dataset,
+                     targets: dict[str, float],
+                     rows: slice,
+                     write: bool = True) -> None:
+    """
+    Set landunit fractions and rescale the others so that all add up to 100.
+
+    Args:
+        ds (nc.Dataset): surface data opened for writing
+        targets (dict[str, float]): percent per landunit variable, e.g. {"PCT_CROP": 20}
+        rows (slice): block of latitude rows to update
+        write (bool): write the new fractions, False only checks them
+    """
+    present = [v for v in landunit_vars if v in ds.variables]
+    lu = {v: np.ma.filled(ds.variables[v][..., rows, :].astype(np.float64), 0.0) for v in present}
+
+    new = landunit_fractions(lu, targets)
+
+    if write:
+        for v in present:
+            ds.variables[v][..., rows, :] = new[v]
+
+
+def adjust_file(path: str,
+                settings: dict,
+                chunk_rows: int = 64) -> dict:
+    """
+    Rewrite the PFT and landunit fractions of one surface data file in place.
+
+    The file is processed in blocks of latitude rows, so memory is bounded
+    by the block size and the file is never copied.
+
+    Args:
+        path (str): surfdata file
+        settings (dict): mode, and nat_pft / cft as {CLM PFT number: value} mappings or
+                         nat_pft_field / cft_field as {path, var} gridded weights,
+                         and landunits as {variable: percent}
+        chunk_rows (int): latitude rows per block
+
+    Returns:
+        dict: file, status, seconds and error message
+    """
+    t0 = time.perf_counter()
+    result = {"file": path, "status": "ok", "seconds": 0.0, "error": ""}
+    mode = settings.get("mode", "replace")
+
+    try:
+        with nc.Dataset(path, "r+") as ds:
+
+            n_lat = ds.variables["PCT_NAT_PFT"].shape[-2]
+            pfts = {var: pft_numbers(ds, name) for var, name in (("nat_pft", "PCT_NAT_PFT"), ("cft", "PCT_CFT"))
+                    if var in settings}
+
+            # check the landunit targets of all cells before anything is written
+            if "landunits" in settings:
+                for j0 in range(0, n_lat, chunk_rows):
+                    adjust_landunits(ds, settings["landunits"], slice(j0, min(j0 + chunk_rows, n_lat)), write=False)
+
+            fields = {}
+            for var in ("nat_pft", "cft"):
+                if f"{var}_field" in settings:
+                    field = settings[f"{var}_field"]
+                    fields[var] = nc.Dataset(field["path"])
+
+            try:
+                for j0 in range(0, n_lat, chunk_rows):
+
+                    rows = slice(j0, min(j0 + chunk_rows, n_lat))
+
+                    for var, name in (("nat_pft", "PCT_NAT_PFT"), ("cft", "PCT_CFT")):
+
+                        if var not in settings and var not in fields:
+                            continue
+
+                        pct = ds.variables[name][:, rows, :].astype(np.float64)
+
+                        if var in fields:
+                            target = fields[var].variables[settings[f"{var}_field"]["var"]][:, rows, :]
+                        else:
+                            target = target_weights(settings[var], pfts[var], mode)
+
+                        # cells masked in the file stay masked
+                        new = apply_ratios(np.ma.filled(pct, 0.0), target, mode)
+                        ds.variables[name][:, rows, :] = np.ma.array(new, mask=np.ma.getmaskarray(pct))
+
+                    if "landunits" in settings:
+                        adjust_landunits(ds, settings["landunits"], rows)
+            finally:
+                for f in fields.values():
+                    f.close()
+
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["seconds"] = round(time.perf_counter() - t0, 3)
+    return result
+
+
+if __name__ == "__main__":
+
+    config = yaml.safe_load(open(config_file))
+
+    if not isinstance(config, dict):
+        raise ValueError("Configuration file is empty or not found.")
+
+    files = config["files"]
+    chunk_rows = config.get("chunk_rows", 64)
+
+    with ProcessPoolExecutor(max_workers=config.get("workers", 1)) as pool:
+
+        futures = [pool.submit(adjust_file, f["path"], f, chunk_rows) for f in files]
+
+        n_failed = 0
+        for fut in as_completed(futures):
+            r = fut.result()
+            n_failed += r["status"] != "ok"
+            print(f"{os.path.basename(r['file'])}: {r['status']} in {r['seconds']:.1f} s"
+                  + (f" ({r['error']})" if r["error"] else ""))
+
+    if n_failed:
+        raise SystemExit(f"{n_failed} file(s) failed.")
@@ -0,0 +1,318 @@
+import os
+import sys
+import glob
+import yaml
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+
+from mapping_cache import station_mapping
+from writers import open_writer
+from extract_sites import data_variables
+
+try:
+    from stage_log import StageLog
+except ImportError:
+    # run directly from its directory, stage_log.py is in src/
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    from stage_log import StageLog
+
+
+def neighbourhood_cells(cells_j: np.ndarray,
+                        cells_i: np.ndarray,
+                        shape: tuple[int],
+                        size: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cells of the square window of size x size cells around each station cell.
+
+    Args:
+        cells_j (np.ndarray): row index of the station cells
+        cells_i (np.ndarray): column index of the station cells
+        shape (tuple[int]): shape of the grid
+        size (int): edge length of the window in cells, odd
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: row and column indices (n_stations, size * size),
+                                                   clipped to the grid, and whether they are inside it
+    """
+    if size % 2 != 1:
+        raise ValueError(f"Neighbourhood size must be odd, got {size}.")
+
+    h = size // 2
+    dj, di = np.meshgrid(np.arange(-h, h + 1), np.arange(-h, h + 1), indexing="ij")
+    jj = cells_j[:, np.newaxis] + dj.ravel()
+    ii = cells_i[:, np.newaxis] + di.ravel()
+    inside = (jj >= 0) & (jj < shape[0]) & (ii >= 0) & (ii < shape[1])
+    return np.clip(jj, 0, shape[0] - 1), np.clip(ii, 0, shape[1] - 1), inside
+
+
+def region_weights(regions: np.ndarray,
+                   values: list | None = None,
+                   weights: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Weight matrix of the regional means.
+
+    Args:
+        regions (np.ndarray): region id per grid cell (lat, lon), e.g. a land mask
+        values (list | None): region ids to average over, all non-zero ids if None
+        weights (np.ndarray | None): weight per grid cell, e.g. the cell area
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: weights (n_cells, n_regions), region ids
+    """
+    regions = np.ma.filled(np.ma.asarray(regions), 0).ravel()
+    if values is None:
+        values = np.unique(regions[regions != 0])
+    values = np.asarray(values)
+
+    w = np.ones(regions.shape) if weights is None else np.ma.filled(np.ma.asarray(weights, dtype=np.float64), 0.0).ravel()
+    return (regions[:, np.newaxis] == values[np.newaxis, :]) * w[:, np.newaxis], values
+
+
+def reduce_block(block: np.ndarray,
+                 cells_j: np.ndarray,
+                 cells_i: np.ndarray,
+                 nbr: tuple[np.ndarray, np.ndarray, np.ndarray] | None,
+                 weights: np.ndarray | None) -> np.ndarray:
+    """
+    Point values, neighbourhood means and regional means of one block of time steps.
+
+    Missing values (NaN) are left out of the means.
+
+    Args:
+        block (np.ndarray): values (time, [level,] lat, lon)
+        cells_j (np.ndarray): row index of the station cells
+        cells_i (np.ndarray): column index of the station cells
+        nbr (tuple | None): neighbourhood cells, see neighbourhood_cells
+        weights (np.ndarray | None): regional weights, see region_weights
+
+    Returns:
+        np.ndarray: (time, [level,] n_out, 1) with the points, then the neighbourhood
+                    means of all stations, then the regional means
+    """
+    block = np.asarray(block, dtype=np.result_type(block.dtype, np.float32))
+    out = [block[..., cells_j, cells_i]]
+
+    if nbr is not None:
+        jj, ii, inside = nbr
+        window = np.where(inside, block[..., jj, ii], np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            count = (~np.isnan(window)).sum(axis=-1)
+            out.append(np.where(count > 0, np.nansum(window, axis=-1) / np.maximum(count, 1), np.nan))
+
+    if weights is not None:
+        flat = block.reshape(block.shape[:-2] + (-1,))
+        valid = ~np.isnan(flat)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            total = np.where(valid, flat, 0.0) @ weights
+            out.append(total / (valid @ weights))
+
+    return np.concatenate(out, axis=-1).astype(block.dtype)[..., np.newaxis]
+
+
+def open_history(files: list[str],
+                 time_chunk: int):
+    """
+    Open the history files lazily as one dataset, chunked along time only.
+
+    Times are not decoded, they are converted like in extract_sites.py.
+    """
+    import xarray as xr
+
+    return xr.open_mfdataset(files, combine="nested", concat_dim="time",
+                             data_vars="minimal", coords="minimal", compat="override",
+                             decode_times=False, chunks={"time": time_chunk})
+
+
+def reduced_arrays(ds,
+                   var_names: list[str],
+                   cells_j: np.ndarray,
+                   cells_i: np.ndarray,
+                   nbr: tuple[np.ndarray, np.ndarray, np.ndarray] | None,
+                   weights: np.ndarray | None) -> dict:
+    """
+    Lazy reductions of each variable, (time, [level,] n_out) dask arrays.
+
+    Every chunk is read once and reduced right away, so memory is bounded by
+    the chunk size times the number of chunks computed at the same time.
+    """
+    n_out = len(cells_j) * (2 if nbr is not None else 1) + (weights.shape[1] if weights is not None else 0)
+    reduced = {}
+
+    for v in var_names:
+        arr = ds[v].data
+        if arr.ndim not in (3, 4):
+            raise NotImplementedError(f"Variable with ndim = {arr.ndim} not implemented.")
+
+        # whole grid per chunk, the reductions need all cells of a time step
+        arr = arr.rechunk({arr.ndim - 2: -1, arr.ndim - 1: -1})
+        dtype = np.result_type(arr.dtype, np.float32)
+
+        out = arr.map_blocks(reduce_block, cells_j, cells_i, nbr, weights,
+                             chunks=arr.chunks[:-2] + ((n_out,), (1,)), dtype=dtype)
+        reduced[v] = out[..., 0]
+
+    return reduced
+
+
+def iter_reduced_blocks(reduced: dict,
+                        time: np.ndarray,
+                        block_steps: int):
+    """
+    Compute the reductions block by block.
+
+    Yields:
+        tuple[np.ndarray, dict[str, np.ndarray]]: time stamps and values (time, [level,] n_out) per variable
+    """
+    import dask
+
+    for t0 in range(0, len(time), block_steps):
+        t1 = min(t0 + block_steps, len(time))
+        values = dask.compute({v: arr[t0:t1] for v, arr in reduced.items()})[0]
+        yield time[t0:t1], values
+
+
+def aggregate_sites(config: dict) -> list[str]:
+    """
+    Station points, neighbourhood means and regional means from eCLM history files.
+
+    Uses the sections of config_extract_sites.yaml and its aggregate section.
+    The history files are read lazily with xarray and dask in chunks of time
+    steps, the whole cube is never loaded. Incremental updates are not supported.
+
+    Args:
+        config (dict): settings with the sections of config_extract_sites.yaml
+
+    Returns:
+        list[str]: output paths
+    """
+    agg = config.get("aggregate", {})
+    log_config = config.get("log", {})
+    log = StageLog("aggregate_sites", path=log_config.get("path"), profile=log_config.get("profile"))
+
+    with log.stage("mapping"):
+
+        file_stations = glob.glob(config["stations"]["path"])
+        if len(file_stations) != 1:
+            raise FileNotFoundError(f"No or multiple station file(s) found at {config['stations']['path']}")
+
+        ds_stations = pd.read_csv(file_stations[0])
+        lats = ds_stations[config["stations"]["lat_col"]].to_numpy()
+        lons = ds_stations[config["stations"]["lon_col"]].to_numpy()
+        ids = ds_stations[config["stations"]["id_col"]].to_numpy()
+
+        file_geo = glob.glob(config["geo"]["path"])
+        if len(file_geo) == 0:
+            raise FileNotFoundError(f"No geo files found at {config['geo']['path']}")
+
+        mapping = station_mapping(file_geo[0],
+                                  config["geo"]["lat_name"],
+                                  config["geo"]["lon_name"],
+                                  ids, lats, lons,
+                                  cache_dir=config.get("cache", {}).get("path"))
+
+        cells_j, cells_i = mapping["j"], mapping["i"]
+
+    files = sorted(glob.glob(config["data"]["path"]))
+    if len(files) == 0:
+        raise FileNotFoundError(f"No data files found at {config['data']['path']}")
+
+    variables = data_variables(config["data"])
+    var_names = [v for v, _ in variables]
+    units = dict(variables)
+
+    with log.stage("open", files=len(files)):
+
+        ds = open_history(files, agg.get("time_chunk", 46))
+
+        time_var = ds["time"]
+        time_units, calendar = time_var.attrs["units"], time_var.attrs.get("calendar", "standard")
+        time = np.array(nc.num2date(time_var.values, units=time_units, calendar=calendar))
+
+        shape = ds[var_names[0]].shape[-2:]
+        level_dims = {v: ds[v].dims[1] if ds[v].ndim == 4 else None for v in var_names}
+        level_sizes = {v: ds[v].shape[1] for v in var_names if level_dims[v]}
+        dtypes = {v: np.result_type(ds[v].dtype, np.float32) for v in var_names}
+
+    size = agg.get("neighbourhood", 0)
+    nbr = neighbourhood_cells(cells_j, cells_i, shape, size) if size > 1 else None
+
+    weights = None
+    regions = agg.get("regions")
+    if regions is not None:
+        with nc.Dataset(regions["path"]) as ds_regions:
+            region_ids = ds_regions[regions["var"]][:]
+            cell_weights = ds_regions[regions["weights"]][:] if regions.get("weights") else None
+        weights, region_values = region_weights(region_ids, regions.get("values"), cell_weights)
+
+    reduced = reduced_arrays(ds, var_names, cells_j, cells_i, nbr, weights)
+
+    out = config["out"]
+    out_format = out.get("format", "csv")
+    layout = out.get("layout", "columns")
+    n_s = len(ids)
+
+    # neighbourhood means are written as further variables of the stations
+    station_vars = {v: v for v in var_names}
+    if nbr is not None:
+        station_vars.update({f"{v}_nbr{size}": v for v in var_names})
+
+    writer_args = dict(time_units=time_units, calendar=calendar, append=False)
+    stem, ext = os.path.splitext(out["path"])
+    paths = [agg.get("path", f"{stem}_aggregate{ext}")]
+    writers = [open_writer(out_format, paths[0],
+                           ids=ids,
+                           units={k: units[v] for k, v in station_vars.items()},
+                           level_dims={k: level_dims[v] for k, v in station_vars.items()},
+                           level_sizes={k: level_sizes[v] for k, v in station_vars.items() if level_dims[v]},
+                           dtypes={k: dtypes[v] for k, v in station_vars.items()},
+                           layout=layout, mapping=mapping, lats=lats, lons=lons, **writer_args)]
+
+    if weights is not None:
+        # regions have no cell, their centre is the weighted mean of the cell coordinates
+        with nc.Dataset(file_geo[0]) as ds_geo:
+            lat2d = np.asarray(ds_geo[config["geo"]["lat_name"]][:], dtype=np.float64).ravel()
+            lon2d = np.asarray(ds_geo[config["geo"]["lon_name"]][:], dtype=np.float64).ravel()
+        centre_lat = lat2d @ weights / weights.sum(axis=0)
+        centre_lon = lon2d @ weights / weights.sum(axis=0)
+        n_r = len(region_values)
+        region_mapping = {"j": np.full(n_r, -1), "i": np.full(n_r, -1),
+                          "cell_lat": centre_lat, "cell_lon": centre_lon, "dist_km": np.zeros(n_r)}
+        paths.append(regions.get("path_out", f"{stem}_regions{ext}"))
+        writers.append(open_writer(out_format, paths[1],
+                                   ids=np.array([f"region{r}" for r in region_values]),
+                                   units=units, level_dims=level_dims, level_sizes=level_sizes, dtypes=dtypes,
+                                   layout=layout, mapping=region_mapping, lats=centre_lat, lons=centre_lon,
+                                   **writer_args))
+
+    for p in paths:
+        os.makedirs(os.path.dirname(p) or ".", exist_ok=True)
+
+    block_steps = agg.get("time_chunk", 46) * agg.get("chunks_per_block", 4)
+
+    with log.stage("reduce_write", files=len(files), time_steps=len(time)):
+
+        for t, values in iter_reduced_blocks(reduced, time, block_steps):
+
+            station_values = {v: arr[..., :n_s] for v, arr in values.items()}
+            if nbr is not None:
+                station_values.update({f"{v}_nbr{size}": arr[..., n_s:2 * n_s] for v, arr in values.items()})
+            writers[0].write(t, station_values)
+
+            if weights is not None:
+                writers[1].write(t, {v: arr[..., (2 if nbr is not None else 1) * n_s:] for v, arr in values.items()})
+
+        for w in writers:
+            w.close()
+
+    ds.close()
+    return paths
+
+
+if __name__ == "__main__":
+
+    config = yaml.safe_load(open("config_extract_sites.yaml"))
+
+    if not isinstance(config, dict): raise ValueError("Config file is empty or invalid.")
+
+    aggregate_sites(config)
@@ -1,10 +1,23 @@
 import glob
 import yaml
 import os
+import sys
 import numpy as np
 import pandas as pd
 import netCDF4 as nc
 
+from mapping_cache import station_mapping
+from point_reader import iter_file_blocks
+from writers import open_writer
+from manifest import manifest_path, file_entry, run_signature, load_manifest, save_manifest, plan_update
+
+try:
+    from stage_log import StageLog
+except ImportError:
+    # run directly from its directory, stage_log.py is in src/
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    from stage_log import StageLog
+
 
 def grid_to_points(lat: np.ndarray, 
                    lon: np.ndarray) -> np.ndarray:
@@ -49,69 +62,220 @@ def closest_cell(coords_point: np.ndarray,
     return closest_cell, closest_coords
 
 
-if __name__ == "__main__":
+def data_variables(config_data: dict) -> list[tuple[str, str]]:
+    """
+    Variables to extract from the data section of the config.
+
+    Accepts either a list under "variables" with name/unit entries or
+    the single var_name/var_unit pair.
+
+    Args:
+        config_data (dict): data section of the config
+
+    Returns:
+        list[tuple[str, str]]: (name, unit) per variable
+    """
+    if "variables" in config_data:
+        return [(v["name"], v.get("unit", "")) for v in config_data["variables"]]
+    return [(config_data["var_name"], config_data["var_unit"])]
+
+
+def extract_sites(config: dict) -> str:
+    """
+    Extract the station time series of one or more variables from eCLM history files.
     
-    config = yaml.safe_load(open("config_extract_sites.yaml"))
+    Relative paths in the config are relative to the working directory.
     
-    if not isinstance(config, dict): raise ValueError("Config file is empty or invalid.")
+    Args:
+        config (dict): settings with the sections of config_extract_sites.yaml
+        
+    Returns:
+        str: output path
+    """
     
-    file_stations = glob.glob(config["stations"]["path"])    
-    if len(file_stations) != 1:
-        raise FileNotFoundError(f"No or multiple station file(s) found at {config['stations']['path']}")
-
-    ds_stations = pd.read_csv(file_stations[0])
+    log_config = config.get("log", {})
+    log = StageLog("extract_sites", path=log_config.get("path"), profile=log_config.get("profile"))
     
-    lats = ds_stations[config["stations"]["lat_col"]].to_numpy()
-    lons = ds_stations[config["stations"]["lon_col"]].to_numpy()
-    ids = ds_stations[config["stations"]["id_col"]].to_numpy()
+    with log.stage("stations") as stage:
+        
+        file_stations = glob.glob(config["stations"]["path"])    
+        if len(file_stations) != 1:
+            raise FileNotFoundError(f"No or multiple station file(s) found at {config['stations']['path']}")
     
-    assert len(lats) == len(lons), "Latitude and Longitude columns must have the same length."
+        ds_stations = pd.read_csv(file_stations[0])
+        
+        lats = ds_stations[config["stations"]["lat_col"]].to_numpy()
+        lons = ds_stations[config["stations"]["lon_col"]].to_numpy()
+        ids = ds_stations[config["stations"]["id_col"]].to_numpy()
+        
+        assert len(lats) == len(lons), "Latitude and Longitude columns must have the same length."
+        stage["stations"] = len(ids)
 
-    file_data = glob.glob(config["data"]["path"])
-    if len(file_data) == 0:
-        raise FileNotFoundError(f"No data files found at {config['data']['path']}")
-    elif len(file_data) == 1:
-        ds_data = nc.Dataset(file_data[0])
-    else:
-        ds_data = nc.MFDataset(sorted(file_data), aggdim="time")
+    with log.stage("mapping"):
+        
+        file_geo = glob.glob(config["geo"]["path"])
+        if len(file_geo) == 0:
+            raise FileNotFoundError(f"No geo files found at {config['geo']['path']}")
+        
+        mapping = station_mapping(file_geo[0],
+                                  config["geo"]["lat_name"],
+                                  config["geo"]["lon_name"],
+                                  ids, lats, lons,
+                                  cache_dir=config.get("cache", {}).get("path"))
+        
+        cells_j, cells_i = mapping["j"], mapping["i"]
 
-    time = nc.num2date(ds_data.variables["time"][:],
-                     units=ds_data.variables["time"].units, 
-                     calendar=ds_data.variables["time"].calendar)
+    variables = data_variables(config["data"])
+    var_names = [v for v, _ in variables]
+    units = dict(variables)
+    layout = config["out"].get("layout", "columns")
+    
+    with log.stage("metadata") as stage:
+        
+        file_data = glob.glob(config["data"]["path"])
+        if len(file_data) == 0:
+            raise FileNotFoundError(f"No data files found at {config['data']['path']}")
+        stage["files"] = len(file_data)
+        
+        # Level dimensions, dtypes and time axis, taken from the first file
+        with nc.Dataset(sorted(file_data)[0]) as ds_first:
+            level_dims = {v: ds_first.variables[v].dimensions[1] 
+                          if ds_first.variables[v].ndim == 4 else None 
+                          for v in var_names}
+            level_sizes = {v: ds_first.variables[v].shape[1] 
+                           for v in var_names if level_dims[v]}
+            dtypes = {v: np.result_type(ds_first.variables[v].dtype, np.float32) 
+                      for v in var_names}
+            time_units = ds_first.variables["time"].units
+            calendar = ds_first.variables["time"].calendar
     
-    var = ds_data.variables[config["data"]["var_name"]][:]
+    os.makedirs(os.path.dirname(config["out"]["path"]) or ".", exist_ok=True)
     
-    file_geo = glob.glob(config["geo"]["path"])
-    if len(file_geo) == 0:
-        raise FileNotFoundError(f"No geo files found at {config['geo']['path']}")
+    out_format = config["out"].get("format", "csv")
+    files = sorted(file_data)
+    append = False
+    last_time = None
+    
+    # Incremental mode, read only files not yet in the manifest and append
+    if config["out"].get("incremental", False):
+        
+        signature = run_signature(out_format, layout, variables, ids, cells_j, cells_i)
+        manifest = load_manifest(manifest_path(config["out"]["path"]))
+        files, append = plan_update(files, manifest, signature, config["out"]["path"])
+        
+        if append:
+            last_time = manifest["last_time"]
+            print(f"Incremental update: {len(files)} new file(s).")
+        
+        if len(files) == 0:
+            return config["out"]["path"]
+    
+    read_mode = config["data"].get("read_mode", "full")
+    workers = config["data"].get("workers", 1)
+    
+    if workers > 1 and read_mode != "points":
+        raise ValueError(f"workers = {workers} needs read_mode 'points', "
+                         f"'{read_mode}' reads the files in a single process.")
+    
+    if read_mode == "points":
+        
+        # Stream file by file, only the station points are read
+        blocks = iter_file_blocks(files, 
+                                  var_names, 
+                                  cells_j, cells_i,
+                                  workers=workers)
+    
+    elif read_mode == "full":
+    
+        with log.stage("open", files=len(files)):
+            if len(files) == 1:
+                ds_data = nc.Dataset(files[0])
+            else:
+                ds_data = nc.MFDataset(files, aggdim="time")
+    
+            time = nc.num2date(ds_data.variables["time"][:],
+                             units=ds_data.variables["time"].units, 
+                             calendar=ds_data.variables["time"].calendar)
+        
+        values = {}
+        
+        with log.stage("read", variables=var_names):
+            
+            for v in var_names:
+                
+                var = ds_data.variables[v][:]
+                
+                if var.ndim not in (3, 4):
+                    raise NotImplementedError(f"Variable with ndim = {var.ndim} not implemented.")
+                
+                var = np.ma.filled(np.ma.asarray(var, dtype=np.result_type(var.dtype, np.float32)), np.nan)
+                values[v] = var[..., cells_j, cells_i]
+        
+        blocks = [(np.array(time), values)]
+        
     else:
-        ds_geo = nc.Dataset(file_geo[0])
+        raise ValueError(f"Unknown read_mode '{read_mode}', use 'full' or 'points'.")
     
-    lat2d = ds_geo[config["geo"]["lat_name"]][:]
-    lon2d = ds_geo[config["geo"]["lon_name"]][:]
-
-    cells = grid_to_points(lat2d, lon2d)
+    incremental = config["out"].get("incremental", False)
     
-    cols = []
+    if incremental:
+        path_manifest = manifest_path(config["out"]["path"])
+        done = manifest["files"] if append else []
+        # the output is rebuilt, a manifest left by a failure would describe the old output
+        if not append and os.path.isfile(path_manifest):
+            os.remove(path_manifest)
     
-    for i, (lat, lon) in enumerate(zip(lats, lons)):
+    # In "points" mode the files are read while writing
+    with log.stage("write" if read_mode == "full" else "read_write", 
+                   format=out_format, files=len(files)) as stage:
         
-        [lat_i, lon_i], closest_coords = closest_cell(np.array([lat, lon]), cells, lat2d.shape)
+        writer = open_writer(out_format,
+                             config["out"]["path"],
+                             ids=ids, units=units, level_dims=level_dims, layout=layout,
+                             mapping=mapping, lats=lats, lons=lons,
+                             time_units=time_units, calendar=calendar,
+                             level_sizes=level_sizes, dtypes=dtypes,
+                             append=append)
         
-        if var.ndim == 4:
-            raise NotImplementedError("4D variables not implemented yet.")
+        n_steps = 0
+        
+        for time, values in blocks:
             
-        elif var.ndim == 3:
-            array_i = var[..., lat_i, lon_i]
+            # Drop time steps already in the output
+            time_num = nc.date2num(list(time), time_units, calendar)
+            if last_time is not None:
+                keep = time_num > last_time
+                if not keep.any():
+                    continue
+                time, time_num = time[keep], time_num[keep]
+                values = {v: arr[keep] for v, arr in values.items()}
             
-        else:
-            raise NotImplementedError(f"Variable with ndim = {var.ndim} not implemented.")
-        
-        cols.append(pd.DataFrame(array_i, 
-                                 index=np.array(time), 
-                                 columns=[f"site_{ids[i]}_{config['data']['var_name']} [{config['data']['var_unit']}]"]))
+            writer.write(time, values)
+            last_time = float(time_num[-1])
+            n_steps += len(time)
+            
+            # Record the progress after each block, a failing run resumes
+            # after the last written time step instead of appending it again
+            if incremental:
+                writer.flush()
+                save_manifest(path_manifest, {"signature": signature, "last_time": last_time, "files": done})
         
-    df_out = pd.concat(cols, axis=1, copy=False)
+        writer.close()
+        stage["time_steps"] = n_steps
+    
+    if incremental:
+        save_manifest(path_manifest,
+                      {"signature": signature,
+                       "last_time": last_time,
+                       "files": done + [file_entry(f) for f in files]})
+    
+    return config["out"]["path"]
 
-    os.makedirs(os.path.dirname(config["out"]["path"]), exist_ok=True)
-    df_out.to_csv(config["out"]["path"], index_label="time")
\ No newline at end of file
+
+if __name__ == "__main__":
+    
+    config = yaml.safe_load(open("config_extract_sites.yaml"))
+    
+    if not isinstance(config, dict): raise ValueError("Config file is empty or invalid.")
+    
+    extract_sites(config)
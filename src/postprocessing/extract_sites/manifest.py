@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+
+try:
+    from file_utils import atomic_write
+except ImportError:
+    # run directly from its directory, file_utils.py is in src/
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    from file_utils import atomic_write
+
+
+def manifest_path(out_path: str) -> str:
+    """Manifest file belonging to an output file or directory."""
+    return out_path.rstrip("/") + ".manifest.json"
+
+
+def file_entry(path: str) -> dict:
+    """Name, size and modification time of a file."""
+    st = os.stat(path)
+    return {"name": os.path.basename(path), "size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+def run_signature(fmt: str,
+                  layout: str,
+                  variables: list[tuple[str, str]],
+                  ids: np.ndarray,
+                  cells_j: np.ndarray,
+                  cells_i: np.ndarray) -> str:
+    """
+    Hash of the settings that shape the output.
+
+    Appending is only valid while output format, layout, variables,
+    stations and their cells are unchanged.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([fmt, layout, variables]).encode())
+    h.update("\0".join(str(s) for s in ids).encode())
+    h.update(np.ascontiguousarray(cells_j, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(cells_i, dtype=np.int64).tobytes())
+    return h.hexdigest()
+
+
+def load_manifest(path: str) -> dict | None:
+    """Load a manifest, None if it does not exist or is unreadable."""
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(path: str,
+                  manifest: dict) -> None:
+    """Write a manifest atomically."""
+    def write(tmp: str) -> None:
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1)
+    atomic_write(path, write)
+
+
+def plan_update(files: list[str],
+                manifest: dict | None,
+                signature: str,
+                out_path: str) -> tuple[list[str], bool]:
+    """
+    Decide which files to read for an incremental update.
+
+    Files already in the manifest with unchanged size and mtime are
+    skipped. If a processed file changed or disappeared, the settings
+    differ or the output is missing, everything is read again.
+
+    Args:
+        files (list[str]): data files in time order
+        manifest (dict | None): manifest of the previous run
+        signature (str): run_signature of the current settings
+        out_path (str): output file or directory
+
+    Returns:
+        tuple[list[str], bool]: files to read, whether to append to the existing output
+    """
+    if manifest is None or manifest.get("signature") != signature or not os.path.exists(out_path):
+        return files, False
+
+    done = {e["name"]: e for e in manifest["files"]}
+    current = {os.path.basename(f): file_entry(f) for f in files}
+
+    if any(current.get(name) != entry for name, entry in done.items()):
+        print("Processed data files changed since the last run, rebuilding the output.")
+        return files, False
+
+    return [f for f in files if os.path.basename(f) not in done], True
@@ -0,0 +1,134 @@
+import os
+import sys
+import hashlib
+import numpy as np
+import netCDF4 as nc
+
+from spatial_index import CellIndex
+
+try:
+    from file_utils import file_digest, atomic_write
+except ImportError:
+    # run directly from its directory, file_utils.py is in src/
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    from file_utils import file_digest, atomic_write
+
+
+MAPPING_FIELDS: tuple[str] = ("ids", "j", "i", "cell_lat", "cell_lon", "dist_km")
+
+
+def mapping_key(file_geo: str,
+                lat_name: str,
+                lon_name: str,
+                ids: np.ndarray,
+                lats: np.ndarray,
+                lons: np.ndarray) -> str:
+    """
+    Cache key of a station to cell mapping.
+
+    Changes whenever the geo file content, its lat/lon variable names
+    or any station id or coordinate changes.
+
+    Args:
+        file_geo (str): path to the geo (domain) file
+        lat_name (str): name of the latitude variable in the geo file
+        lon_name (str): name of the longitude variable in the geo file
+        ids (np.ndarray): station ids
+        lats (np.ndarray): station latitudes
+        lons (np.ndarray): station longitudes
+
+    Returns:
+        str: hex key
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(file_digest(file_geo).encode())
+    h.update(f"{lat_name}\0{lon_name}\0".encode())
+    h.update("\0".join(str(s) for s in ids).encode())
+    h.update(np.ascontiguousarray(lats, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(lons, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def load_mapping(path: str) -> dict[str, np.ndarray] | None:
+    """Load a cached mapping, None if it does not exist or is unreadable."""
+    if not os.path.isfile(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            return {k: f[k] for k in MAPPING_FIELDS}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save_mapping(path: str,
+                 mapping: dict[str, np.ndarray]) -> None:
+    """Write a mapping atomically so concurrent runs never read a partial file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    atomic_write(path, lambda tmp: np.savez(tmp, **{k: mapping[k] for k in MAPPING_FIELDS}), suffix=".npz")
+
+
+def compute_mapping(file_geo: str,
+                    lat_name: str,
+                    lon_name: str,
+                    ids: np.ndarray,
+                    lats: np.ndarray,
+                    lons: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Map stations to their closest grid cell.
+
+    Returns:
+        dict[str, np.ndarray]: station ids, cell indices j/i,
+                               cell lat/lon and great-circle distance in km
+    """
+    with nc.Dataset(file_geo) as ds_geo:
+        lat2d = ds_geo[lat_name][:]
+        lon2d = ds_geo[lon_name][:]
+
+    index = CellIndex.from_grid(lat2d, lon2d)
+
+    flat_cells, dists = index.query(np.column_stack([lats, lons]))
+    cells_j, cells_i = index.unravel(flat_cells)
+    cell_coords = index.cell_coords(flat_cells)
+
+    return {"ids": np.asarray(ids).astype(str),
+            "j": cells_j.astype(np.int64),
+            "i": cells_i.astype(np.int64),
+            "cell_lat": cell_coords[:, 0],
+            "cell_lon": cell_coords[:, 1],
+            "dist_km": dists}
+
+
+def station_mapping(file_geo: str,
+                    lat_name: str,
+                    lon_name: str,
+                    ids: np.ndarray,
+                    lats: np.ndarray,
+                    lons: np.ndarray,
+                    cache_dir: str | None = None) -> dict[str, np.ndarray]:
+    """
+    Station to cell mapping, reused from the cache if still valid.
+
+    Args:
+        file_geo (str): path to the geo (domain) file
+        lat_name (str): name of the latitude variable in the geo file
+        lon_name (str): name of the longitude variable in the geo file
+        ids (np.ndarray): station ids
+        lats (np.ndarray): station latitudes
+        lons (np.ndarray): station longitudes
+        cache_dir (str | None): cache directory, no caching if None
+
+    Returns:
+        dict[str, np.ndarray]: see compute_mapping
+    """
+    if cache_dir is None:
+        return compute_mapping(file_geo, lat_name, lon_name, ids, lats, lons)
+
+    key = mapping_key(file_geo, lat_name, lon_name, ids, lats, lons)
+    path = os.path.join(cache_dir, f"mapping_{key}.npz")
+
+    mapping = load_mapping(path)
+    if mapping is None:
+        mapping = compute_mapping(file_geo, lat_name, lon_name, ids, lats, lons)
+        save_mapping(path, mapping)
+
+    return mapping
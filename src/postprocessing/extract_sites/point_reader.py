@@ -0,0 +1,175 @@
+from collections.abc import Iterator
+import numpy as np
+import netCDF4 as nc
+
+
+def point_window(cells_j: np.ndarray,
+                 cells_i: np.ndarray) -> tuple[slice, slice, np.ndarray, np.ndarray]:
+    """
+    Smallest window of the grid containing all points.
+
+    Args:
+        cells_j (np.ndarray): row index per point
+        cells_i (np.ndarray): column index per point
+
+    Returns:
+        tuple[slice, slice, np.ndarray, np.ndarray]: row and column slices of the window,
+                                                     row and column index per point inside it
+    """
+    cells_j = np.asarray(cells_j, dtype=np.int64)
+    cells_i = np.asarray(cells_i, dtype=np.int64)
+
+    j0, i0 = int(cells_j.min()), int(cells_i.min())
+    rows = slice(j0, int(cells_j.max()) + 1)
+    cols = slice(i0, int(cells_i.max()) + 1)
+    return rows, cols, cells_j - j0, cells_i - i0
+
+
+def time_steps_per_read(var: nc.Variable,
+                        window: tuple[slice, slice, np.ndarray, np.ndarray],
+                        max_bytes: int = 256 * 2**20) -> int:
+    """
+    Number of time steps read at once, a whole number of time chunks of the file.
+
+    Compressed files are chunked, reading a time step of a chunk decompresses
+    the whole chunk, so every chunk is read exactly once per variable.
+    """
+    rows, cols = window[:2]
+    step_bytes = var.dtype.itemsize * (rows.stop - rows.start) * (cols.stop - cols.start)
+    for n in var.shape[1:-2]:
+        step_bytes *= n
+
+    steps = max(1, max_bytes // step_bytes)
+    chunking = var.chunking()
+    if chunking != "contiguous":
+        steps = max(1, steps // chunking[0]) * chunking[0]
+    return min(steps, max(1, var.shape[0]))
+
+
+def read_points(var: nc.Variable,
+                window: tuple[slice, slice, np.ndarray, np.ndarray],
+                n_points: int) -> np.ndarray:
+    """
+    Read the given grid points of a (time, [level,] lat, lon) variable.
+
+    The window around all points is read once per block of time steps and
+    the points are picked from it in memory, so memory is bounded by the
+    window size times the block length and not by the file size.
+
+    Args:
+        var (nc.Variable): netCDF variable with the grid in the last two dimensions
+        window (tuple): point window from point_window
+        n_points (int): number of points
+
+    Returns:
+        np.ndarray: array of shape (time, [level,] n_points), masked values as NaN
+    """
+    if var.ndim not in (3, 4):
+        raise NotImplementedError(f"Variable with ndim = {var.ndim} not implemented.")
+
+    rows, cols, jj, ii = window
+    dtype = np.result_type(var.dtype, np.float32)
+    out = np.empty(var.shape[:-2] + (n_points,), dtype=dtype)
+
+    steps = time_steps_per_read(var, window)
+    for t0 in range(0, var.shape[0], steps):
+        block = var[t0:t0 + steps, ..., rows, cols]
+        block = np.ma.filled(np.ma.asarray(block, dtype=dtype), np.nan)
+        out[t0:t0 + steps] = block[..., jj, ii]
+
+    return out
+
+
+def read_file(path: str,
+              var_names: list[str],
+              window: tuple[slice, slice, np.ndarray, np.ndarray],
+              n_points: int) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """
+    Extract grid points of several variables from one file.
+
+    Args:
+        path (str): netCDF file
+        var_names (list[str]): variables to extract
+        window (tuple): point window from point_window
+        n_points (int): number of points
+
+    Returns:
+        tuple[np.ndarray, dict[str, np.ndarray]]: time stamps (time,),
+                                                  values (time, [level,] n_points) per variable
+    """
+    with nc.Dataset(path) as ds:
+        time = nc.num2date(ds.variables["time"][:],
+                           units=ds.variables["time"].units,
+                           calendar=ds.variables["time"].calendar)
+        return np.array(time), {v: read_points(ds.variables[v], window, n_points)
+                                for v in var_names}
+
+
+def read_files(files: list[str],
+               var_names: list[str],
+               cells_j: np.ndarray,
+               cells_i: np.ndarray) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """
+    Extract grid points from a subset of files into one time-indexed block.
+
+    Worker function of the parallel extraction, arguments are kept picklable.
+
+    Returns:
+        tuple[np.ndarray, dict[str, np.ndarray]]: time stamps (time,),
+                                                  values (time, [level,] n_points) per variable
+    """
+    window = point_window(cells_j, cells_i)
+    blocks = [read_file(f, var_names, window, len(cells_j)) for f in files]
+    return (np.concatenate([t for t, _ in blocks]),
+            {v: np.concatenate([b[v] for _, b in blocks], axis=0) for v in var_names})
+
+
+def split_files(files: list[str],
+                n_chunks: int) -> list[list[str]]:
+    """Split files into at most n_chunks contiguous, time-ordered subsets."""
+    n_chunks = max(1, min(n_chunks, len(files)))
+    bounds = np.linspace(0, len(files), n_chunks + 1).round().astype(int)
+    return [files[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def iter_file_blocks(files: list[str],
+                     var_names: list[str],
+                     cells_j: np.ndarray,
+                     cells_i: np.ndarray,
+                     workers: int = 1) -> Iterator[tuple[np.ndarray, dict[str, np.ndarray]]]:
+    """
+    Extract grid points of several variables from a list of files.
+
+    All variables are read while a file is open, so the file handling and
+    point window is shared. With one worker files are read one at a time. With more workers the
+    files are split into contiguous subsets read in a process pool, and
+    the blocks are yielded in time order as they become available.
+
+    Args:
+        files (list[str]): netCDF files in time order
+        var_names (list[str]): variables to extract
+        cells_j (np.ndarray): row index per point
+        cells_i (np.ndarray): column index per point
+        workers (int): number of worker processes
+
+    Yields:
+        tuple[np.ndarray, dict[str, np.ndarray]]: time stamps (time,),
+                                                  values (time, [level,] n_points) per variable
+    """
+    if workers <= 1:
+        window = point_window(cells_j, cells_i)
+        for f in files:
+            yield read_file(f, var_names, window, len(cells_j))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # a few subsets per worker to keep the pool busy and the blocks small
+    subsets = split_files(files, workers * 4)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(read_files,
+                            subsets,
+                            [var_names] * len(subsets),
+                            [cells_j] * len(subsets),
+                            [cells_i] * len(subsets))
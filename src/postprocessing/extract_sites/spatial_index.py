@@ -0,0 +1,176 @@
+import numpy as np
+
+
+EARTH_RADIUS_KM: float = 6371.0
+
+
+def latlon_to_xyz(lat: np.ndarray,
+                  lon: np.ndarray) -> np.ndarray:
+    """
+    Convert lat/lon in degrees to 3D coordinates on the unit sphere.
+
+    Args:
+        lat (np.ndarray): latitudes in degrees
+        lon (np.ndarray): longitudes in degrees
+
+    Returns:
+        np.ndarray: Array of shape (n_points, 3) with x/y/z coordinates.
+    """
+    lat_r = np.deg2rad(np.asarray(lat, dtype=np.float64))
+    lon_r = np.deg2rad(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat_r)
+    return np.column_stack([cos_lat * np.cos(lon_r),
+                            cos_lat * np.sin(lon_r),
+                            np.sin(lat_r)])
+
+
+def chord_to_km(chord: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km from a chord length on the unit sphere."""
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))
+
+
+def km_to_chord(dist_km: float) -> float:
+    """Chord length on the unit sphere from a great-circle distance in km."""
+    return 2.0 * np.sin(min(dist_km / EARTH_RADIUS_KM, np.pi) / 2.0)
+
+
+class CellIndex:
+    """
+    Spatial index over the cells of a (curvilinear) lat/lon grid.
+
+    Cells are mapped onto the unit sphere and stored in a KD-tree, so
+    Euclidean (chord) neighbours are great-circle neighbours and the
+    dateline and poles need no special handling. Cells with missing
+    coordinates are left out of the index.
+
+    Falls back to a chunked brute-force search if scipy is not available.
+    """
+
+    chunk_size: int = 256
+
+    def __init__(self,
+                 coords_cells: np.ndarray,
+                 shape: tuple[int]):
+        """
+        Args:
+            coords_cells (np.ndarray): array of cell coordinates (n_cells, 2) [lat, lon]
+            shape (tuple[int]): shape of the original grid
+        """
+        coords_cells = np.ma.filled(np.ma.asarray(coords_cells, dtype=np.float64), np.nan)
+
+        self.shape = tuple(shape)
+        self.coords_cells = coords_cells
+        self.valid = np.flatnonzero(np.all(np.isfinite(coords_cells), axis=1))
+
+        if self.valid.size == 0:
+            raise ValueError("No cell with valid coordinates to build the index from.")
+
+        self._xyz = latlon_to_xyz(coords_cells[self.valid, 0], coords_cells[self.valid, 1])
+
+        try:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self._xyz)
+        except ImportError:
+            self._tree = None
+
+    @classmethod
+    def from_grid(cls,
+                  lat2d: np.ndarray,
+                  lon2d: np.ndarray) -> "CellIndex":
+        """Build the index from 2D lat and lon arrays."""
+        coords_cells = np.dstack([np.ma.filled(lat2d, np.nan),
+                                  np.ma.filled(lon2d, np.nan)]).reshape(-1, 2)
+        return cls(coords_cells, lat2d.shape)
+
+    def _points_xyz(self, coords_points: np.ndarray) -> np.ndarray:
+        coords_points = np.atleast_2d(np.asarray(coords_points, dtype=np.float64))
+        return latlon_to_xyz(coords_points[:, 0], coords_points[:, 1])
+
+    def _brute_force(self, xyz: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        dist = np.empty((len(xyz), k))
+        idx = np.empty((len(xyz), k), dtype=np.int64)
+
+        for start in range(0, len(xyz), self.chunk_size):
+            block = xyz[start:start + self.chunk_size]
+            # squared chord length, |a - b|^2 = 2 - 2 a.b on the unit sphere
+            d2 = np.maximum(2.0 - 2.0 * block @ self._xyz.T, 0.0)
+            part = np.argpartition(d2, k - 1, axis=1)[:, :k] if k < d2.shape[1] else \
+                   np.broadcast_to(np.arange(d2.shape[1]), (len(block), d2.shape[1]))
+            part_d2 = np.take_along_axis(d2, part, axis=1)
+            order = np.argsort(part_d2, axis=1, kind="stable")
+            idx[start:start + len(block)] = np.take_along_axis(part, order, axis=1)
+            dist[start:start + len(block)] = np.sqrt(np.take_along_axis(part_d2, order, axis=1))
+
+        return dist, idx
+
+    def query(self,
+              coords_points: np.ndarray,
+              k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest cells for all points in one batch.
+
+        Args:
+            coords_points (np.ndarray): point coordinates (n_points, 2) [lat, lon]
+            k (int): number of neighbours per point
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: flat cell indices (n_points,) or (n_points, k),
+                                           great-circle distances in km, same shape
+        """
+        if k < 1 or k > self.valid.size:
+            raise ValueError(f"k must be between 1 and {self.valid.size}, got {k}.")
+
+        xyz = self._points_xyz(coords_points)
+
+        if self._tree is not None:
+            chord, idx = self._tree.query(xyz, k=k)
+            chord = np.asarray(chord).reshape(len(xyz), k)
+            idx = np.asarray(idx).reshape(len(xyz), k)
+        else:
+            chord, idx = self._brute_force(xyz, k)
+
+        flat = self.valid[idx]
+        dist = chord_to_km(chord)
+
+        if k == 1:
+            return flat[:, 0], dist[:, 0]
+        return flat, dist
+
+    def query_radius(self,
+                     coords_points: np.ndarray,
+                     radius_km: float) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        Find all cells within a great-circle radius of each point.
+
+        Args:
+            coords_points (np.ndarray): point coordinates (n_points, 2) [lat, lon]
+            radius_km (float): search radius in km
+
+        Returns:
+            list[tuple[np.ndarray, np.ndarray]]: per point, flat cell indices and
+                                                 distances in km sorted by distance
+        """
+        xyz = self._points_xyz(coords_points)
+        r_chord = km_to_chord(radius_km)
+
+        if self._tree is not None:
+            hits = self._tree.query_ball_point(xyz, r_chord)
+        else:
+            hits = [np.flatnonzero(np.sum((self._xyz - p) ** 2, axis=1) <= r_chord ** 2)
+                    for p in xyz]
+
+        out = []
+        for p, h in zip(xyz, hits):
+            h = np.asarray(h, dtype=np.int64)
+            dist = chord_to_km(np.sqrt(np.sum((self._xyz[h] - p) ** 2, axis=1)))
+            order = np.argsort(dist, kind="stable")
+            out.append((self.valid[h[order]], dist[order]))
+        return out
+
+    def unravel(self, flat: np.ndarray) -> tuple[np.ndarray, ...]:
+        """Convert flat cell indices to grid indices (j, i)."""
+        return np.unravel_index(flat, self.shape)
+
+    def cell_coords(self, flat: np.ndarray) -> np.ndarray:
+        """Coordinates [lat, lon] of the given flat cell indices."""
+        return self.coords_cells[flat]
@@ -0,0 +1,303 @@
+import os
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+
+
+def block_frame(time: np.ndarray,
+                values: dict[str, np.ndarray],
+                ids: np.ndarray,
+                units: dict[str, str],
+                level_dims: dict[str, str | None],
+                layout: str = "columns") -> pd.DataFrame:
+    """
+    Arrange extracted station values of several variables in a table.
+
+    Args:
+        time (np.ndarray): time stamps (time,)
+        values (dict[str, np.ndarray]): values (time, [level,] n_stations) per variable
+        ids (np.ndarray): station ids
+        units (dict[str, str]): unit per variable
+        level_dims (dict[str, str | None]): level dimension name per 4D variable, None for 3D
+        layout (str): "columns" for one column per station (and level),
+                      "long" for one row per time, station, variable and level
+
+    Returns:
+        pd.DataFrame: wide table indexed by time, or long table
+    """
+    if layout == "columns":
+        frames = []
+        for v, arr in values.items():
+            if arr.ndim == 2:
+                columns = [f"site_{s}_{v} [{units[v]}]" for s in ids]
+            else:
+                columns = [f"site_{s}_{v}_{level_dims[v]}{k} [{units[v]}]"
+                           for s in ids for k in range(arr.shape[1])]
+                # (time, level, station) -> (time, station, level)
+                arr = arr.transpose(0, 2, 1).reshape(arr.shape[0], -1)
+            frames.append(pd.DataFrame(arr, index=time, columns=columns))
+        return frames[0] if len(frames) == 1 else pd.concat(frames, axis=1)
+
+    elif layout == "long":
+        frames = []
+        steps = []
+        for v, arr in values.items():
+            # (time, [level,] station) -> (time, station, level)
+            arr = arr[:, np.newaxis, :] if arr.ndim == 2 else arr
+            n_t, n_l, n_s = arr.shape
+            frames.append(pd.DataFrame({"time": np.repeat(time, n_s * n_l),
+                                        "site": np.tile(np.repeat(ids, n_l), n_t),
+                                        "variable": v,
+                                        "level": np.tile(np.arange(n_l), n_t * n_s)
+                                                 if level_dims[v] else -1,
+                                        "value": arr.transpose(0, 2, 1).ravel(),
+                                        "unit": units[v]}))
+            steps.append(np.repeat(np.arange(n_t), n_s * n_l))
+        # rows ordered by time first, then variable, station and level
+        order = np.argsort(np.concatenate(steps), kind="stable")
+        return pd.concat(frames, ignore_index=True).take(order).reset_index(drop=True)
+
+    else:
+        raise ValueError(f"Unknown layout '{layout}', use 'columns' or 'long'.")
+
+
+def time_to_datetime64(time: np.ndarray) -> np.ndarray:
+    """
+    Convert cftime stamps to datetime64.
+
+    Falls back to ISO strings for calendars with dates that do not exist
+    in the proleptic Gregorian calendar (e.g. 360_day).
+    """
+    try:
+        return np.array([np.datetime64(t.isoformat()) for t in time], dtype="datetime64[s]")
+    except ValueError:
+        return np.array([t.isoformat() for t in time])
+
+
+class CSVWriter:
+    """Text output, wide or long table appended block by block."""
+
+    def __init__(self,
+                 path: str,
+                 ids: np.ndarray,
+                 units: dict[str, str],
+                 level_dims: dict[str, str | None],
+                 layout: str = "columns",
+                 append: bool = False,
+                 **kwargs):
+        self.path = path
+        self.ids = ids
+        self.units = units
+        self.level_dims = level_dims
+        self.layout = layout
+        self._n = 1 if append else 0
+
+    def write(self,
+              time: np.ndarray,
+              values: dict[str, np.ndarray]) -> None:
+        df_out = block_frame(time, values, self.ids, self.units, self.level_dims, self.layout)
+        df_out.to_csv(self.path,
+                      mode="w" if self._n == 0 else "a",
+                      header=(self._n == 0),
+                      index=(self.layout == "columns"),
+                      index_label="time")
+        self._n += 1
+
+    def flush(self) -> None:
+        # every block is written and closed by to_csv
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class ParquetWriter:
+    """
+    Long-format Parquet dataset partitioned by variable.
+
+    Writes one file per variable and run under <path>/variable=<name>/ with
+    the columns time, site, level and value. Each block becomes a row group
+    built directly from the NumPy arrays, no intermediate frames. Appending
+    adds a new part file. Parts are written as hidden files and renamed when
+    complete, flush completes the current parts and starts new ones.
+    """
+
+    def __init__(self,
+                 path: str,
+                 ids: np.ndarray,
+                 units: dict[str, str],
+                 level_dims: dict[str, str | None],
+                 append: bool = False,
+                 **kwargs):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output requires pyarrow.") from e
+
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.ids = np.asarray(ids).astype(str)
+        self.units = units
+        self.level_dims = level_dims
+        self.append = append
+        self._started = False
+        self._writers = {}
+
+    def write(self,
+              time: np.ndarray,
+              values: dict[str, np.ndarray]) -> None:
+        pa = self._pa
+        time = time_to_datetime64(time)
+
+        for v, arr in values.items():
+            # (time, [level,] station) -> (time, station, level)
+            arr = arr[:, np.newaxis, :] if arr.ndim == 2 else arr
+            n_t, n_l, n_s = arr.shape
+
+            table = pa.table({"time": np.repeat(time, n_s * n_l),
+                              "site": np.tile(np.repeat(self.ids, n_l), n_t),
+                              "level": np.tile(np.arange(n_l, dtype=np.int16), n_t * n_s)
+                                       if self.level_dims[v] else np.full(n_t * n_s, -1, dtype=np.int16),
+                              "value": np.ascontiguousarray(arr.transpose(0, 2, 1)).ravel()})
+
+            if v not in self._writers:
+                part = os.path.join(self.path, f"variable={v}")
+                if not self.append and not self._started and os.path.isdir(part):
+                    for f in os.listdir(part):
+                        os.remove(os.path.join(part, f))
+                os.makedirs(part, exist_ok=True)
+                n_parts = sum(f.endswith(".parquet") and not f.startswith(".") for f in os.listdir(part))
+                path = os.path.join(part, f"part-{n_parts}.parquet")
+                schema = table.schema.with_metadata({"variable": v, 
+                                                     "unit": self.units[v],
+                                                     "level_dim": self.level_dims[v] or ""})
+                tmp = os.path.join(part, f".part-{n_parts}.parquet.tmp")
+                self._writers[v] = (self._pq.ParquetWriter(tmp, schema, compression="zstd"), tmp, path)
+
+            writer = self._writers[v][0]
+            writer.write_table(table.replace_schema_metadata(writer.schema.metadata))
+
+        self._started = True
+
+    def flush(self) -> None:
+        for writer, tmp, path in self._writers.values():
+            writer.close()
+            os.replace(tmp, path)
+        self._writers = {}
+
+    def close(self) -> None:
+        self.flush()
+
+
+class NetCDFWriter:
+    """
+    Station-dimensioned NetCDF with (station, [level,] time) arrays.
+
+    Station ids, coordinates and the matched grid cells are stored as
+    station metadata. Blocks are appended along the unlimited time axis,
+    also to an existing file when appending. The time stamps of a block are
+    written last, so a block cut off by a failure is overwritten on append.
+    """
+
+    def __init__(self,
+                 path: str,
+                 ids: np.ndarray,
+                 units: dict[str, str],
+                 level_dims: dict[str, str | None],
+                 mapping: dict[str, np.ndarray],
+                 lats: np.ndarray,
+                 lons: np.ndarray,
+                 time_units: str,
+                 calendar: str,
+                 level_sizes: dict[str, int],
+                 dtypes: dict[str, np.dtype],
+                 complevel: int = 4,
+                 append: bool = False,
+                 **kwargs):
+        self.path = path
+        self.time_units = time_units
+        self.calendar = calendar
+
+        if append:
+            self.ds = nc.Dataset(path, "a")
+            self._t = int(np.ma.count(self.ds.variables["time"][:]))
+            return
+
+        self._t = 0
+
+        n_s = len(ids)
+        self.ds = nc.Dataset(path, "w", format="NETCDF4")
+        self.ds.createDimension("station", n_s)
+        self.ds.createDimension("time", None)
+
+        time = self.ds.createVariable("time", np.float64, ("time",))
+        time.setncatts({"units": time_units, "calendar": calendar, "axis": "T"})
+
+        station_vars = {"station_id": (str, np.asarray(ids).astype(str), {"long_name": "station id"}),
+                        "station_lat": (np.float64, lats, {"units": "degrees_north"}),
+                        "station_lon": (np.float64, lons, {"units": "degrees_east"}),
+                        "cell_j": (np.int32, mapping["j"], {"long_name": "row index of the grid cell"}),
+                        "cell_i": (np.int32, mapping["i"], {"long_name": "column index of the grid cell"}),
+                        "cell_lat": (np.float64, mapping["cell_lat"], {"units": "degrees_north"}),
+                        "cell_lon": (np.float64, mapping["cell_lon"], {"units": "degrees_east"}),
+                        "cell_dist": (np.float64, mapping["dist_km"], 
+                                      {"long_name": "great-circle distance station to cell", "units": "km"})}
+
+        for name, (dtype, data, atts) in station_vars.items():
+            var = self.ds.createVariable(name, dtype, ("station",))
+            var.setncatts(atts)
+            var[:] = np.asarray(data)
+
+        for v, unit in units.items():
+            dims = ("station", "time")
+            chunks = [n_s, 256]
+            if level_dims[v]:
+                if level_dims[v] not in self.ds.dimensions:
+                    self.ds.createDimension(level_dims[v], level_sizes[v])
+                dims = ("station", level_dims[v], "time")
+                chunks = [n_s, level_sizes[v], 256]
+            var = self.ds.createVariable(v, dtypes[v], dims, zlib=complevel > 0, complevel=complevel,
+                                         shuffle=True, chunksizes=chunks, fill_value=np.nan)
+            var.setncatts({"units": unit})
+
+    def write(self,
+              time: np.ndarray,
+              values: dict[str, np.ndarray]) -> None:
+        t0, t1 = self._t, self._t + len(time)
+        for v, arr in values.items():
+            # (time, [level,] station) -> (station, [level,] time)
+            self.ds.variables[v][..., t0:t1] = arr.T
+        self.ds.variables["time"][t0:t1] = nc.date2num(list(time), self.time_units, self.calendar)
+        self._t = t1
+
+    def flush(self) -> None:
+        self.ds.sync()
+
+    def close(self) -> None:
+        self.ds.close()
+
+
+WRITERS: dict[str, type] = {"csv": CSVWriter,
+                            "parquet": ParquetWriter,
+                            "netcdf": NetCDFWriter}
+
+
+def open_writer(fmt: str, 
+                path: str, 
+                **kwargs) -> CSVWriter | ParquetWriter | NetCDFWriter:
+    """
+    Open an output writer for extracted station data.
+
+    Args:
+        fmt (str): output format, one of "csv", "parquet", "netcdf"
+        path (str): output file (csv, netcdf) or directory (parquet)
+        **kwargs: writer arguments, unused ones are ignored
+
+    Returns:
+        CSVWriter | ParquetWriter | NetCDFWriter: writer with write(time, values), flush() and close()
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown output format '{fmt}', use one of {list(WRITERS)}.")
+    return WRITERS[fmt](path, **kwargs)
@@ -0,0 +1,265 @@
+"""
+Per-stage timing, memory and I/O records of the pipelines, written as JSON lines.
+
+    log = StageLog("extract_sites", path="out/stages.jsonl")
+    with log.stage("read", files=12):
+        ...
+
+Each stage adds one record with wall time, peak RSS during the stage,
+current RSS and the bytes read and written by the process. Records of all runs can be appended
+to the same file and aggregated with pandas.read_json(path, lines=True).
+
+The log is off unless a path is given or set by the STAGE_LOG environment
+variable. With profile (or STAGE_PROFILE=1) the call stacks of the main
+thread are sampled during each stage and written in collapsed stack format
+to <path>.stacks, which flamegraph.pl and speedscope read directly.
+
+Memory and I/O are taken from /proc on Linux, elsewhere only the peak RSS
+of the process from getrusage is available. The peak of a stage is the
+process high water mark VmHWM if the stage raised it (rss_peak_exact),
+otherwise the highest RSS polled during the stage, which can miss short
+spikes. VmHWM is never reset, so getrusage and other measurements in the
+same process are not affected. Worker processes report their own
+counters, their peak RSS is also in rss_children_peak_mb.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import resource
+import threading
+import contextlib
+from collections import Counter
+
+
+def _proc_status() -> dict[str, int]:
+    """VmRSS and VmHWM of this process in bytes, empty if /proc is not available."""
+    out = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, value, _ = line.split()
+                    out[key[:-1]] = int(value) * 1024
+    except OSError:
+        pass
+    return out
+
+
+def _current_rss() -> int | None:
+    """RSS of this process in bytes from /proc/self/statm, None if not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _proc_io() -> dict[str, int]:
+    """Bytes read and written by this process, from storage and in total."""
+    out = {}
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                key, value = line.split(":")
+                out[key] = int(value)
+    except OSError:
+        pass
+    return out
+
+
+def _maxrss(who: int) -> float:
+    """Peak RSS from getrusage in MB, ru_maxrss is in kB on Linux and bytes on macOS."""
+    unit = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss * unit / 2**20
+
+
+class StackSampler:
+    """
+    Minimal sampling profiler: records the call stack of one thread at a fixed interval.
+
+    Args:
+        interval (float): seconds between samples
+        thread_id (int | None): thread to sample, default the calling thread
+    """
+
+    def __init__(self,
+                 interval: float = 0.005,
+                 thread_id: int | None = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+class PeakSampler:
+    """
+    Highest RSS of this process while running, polled at a fixed interval.
+
+    Args:
+        interval (float): seconds between polls
+    """
+
+    def __init__(self,
+                 interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _poll(self) -> None:
+        self.peak = max(self.peak, _current_rss() or 0)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._poll()
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._poll()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> int:
+        self._stop.set()
+        self._thread.join()
+        self._poll()
+        return self.peak
+
+
+class StageLog:
+    """
+    Collects one record per named stage of a run.
+
+    Args:
+        script (str): name of the pipeline, stored with every record
+        path (str | None): JSON lines file the records are appended to,
+                           default STAGE_LOG, no log if neither is set
+        profile (bool | None): sample call stacks per stage, default STAGE_PROFILE
+        interval (float): sampling interval in seconds
+        **info: further fields stored with every record, e.g. the station
+    """
+
+    def __init__(self,
+                 script: str,
+                 path: str | None = None,
+                 profile: bool | None = None,
+                 interval: float = 0.005,
+                 **info):
+        self.script = script
+        self.path = path or os.environ.get("STAGE_LOG") or None
+        self.profile = bool(int(os.environ.get("STAGE_PROFILE", "0"))) if profile is None else profile
+        self.interval = interval
+        self.info = info
+        self.run_id = uuid.uuid4().hex[:12]
+        self.records = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @contextlib.contextmanager
+    def stage(self,
+              name: str,
+              **info):
+        """
+        Measure the enclosed block as one stage.
+
+        Fields added to the yielded dict, e.g. the number of rows, are stored
+        with the record.
+        """
+        extra = dict(info)
+
+        if not self.enabled:
+            yield extra
+            return
+
+        hwm0 = _proc_status().get("VmHWM")
+        peak = None
+        if hwm0 is not None:
+            peak = PeakSampler()
+            peak.start()
+        io0 = _proc_io()
+        sampler = None
+        if self.profile:
+            sampler = StackSampler(self.interval)
+            sampler.start()
+
+        start = time.time()
+        t0 = time.perf_counter()
+        status = "ok"
+
+        try:
+            yield extra
+        except BaseException as e:
+            status = f"failed: {type(e).__name__}"
+            raise
+        finally:
+            seconds = time.perf_counter() - t0
+            stacks = sampler.stop() if sampler is not None else None
+            polled = peak.stop() if peak is not None else None
+            io1 = _proc_io()
+            mem = _proc_status()
+
+            # a new process high water mark was reached during this stage
+            exact = hwm0 is not None and mem.get("VmHWM", 0) > hwm0
+            if exact:
+                rss_peak = mem["VmHWM"] / 2**20
+            elif polled is not None:
+                rss_peak = polled / 2**20
+            else:
+                rss_peak = _maxrss(resource.RUSAGE_SELF)
+
+            record = {"script": self.script,
+                      "run": self.run_id,
+                      "host": socket.gethostname(),
+                      "pid": os.getpid(),
+                      "stage": name,
+                      "status": status,
+                      "start": round(start, 3),
+                      "seconds": round(seconds, 6),
+                      "rss_peak_mb": round(rss_peak, 2),
+                      "rss_peak_is_stage": polled is not None,
+                      "rss_peak_exact": exact,
+                      "rss_mb": round(mem["VmRSS"] / 2**20, 2) if "VmRSS" in mem else None,
+                      "rss_children_peak_mb": round(_maxrss(resource.RUSAGE_CHILDREN), 2)}
+
+            for key, field in (("read_bytes", "read_bytes"), ("write_bytes", "write_bytes"),
+                               ("rchar", "read_chars"), ("wchar", "written_chars")):
+                record[field] = io1[key] - io0[key] if key in io0 and key in io1 else None
+
+            record.update(self.info)
+            record.update(extra)
+            self.records.append(record)
+
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+
+            if stacks:
+                with open(f"{self.path}.stacks", "a") as f:
+                    for stack, count in stacks.most_common():
+                        f.write(f"{self.script};{name};{stack} {count}\n")
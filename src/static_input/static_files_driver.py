@@ -0,0 +1,329 @@
+import os
+import re
+import sys
+import glob
+import json
+import shutil
+import hashlib
+import threading
+import subprocess
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import yaml
+
+try:
+    from file_utils import file_digest, atomic_write
+except ImportError:
+    # run directly from its directory, file_utils.py is in src/
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from file_utils import file_digest, atomic_write
+
+
+config_file: str = "config_static_files.yaml"
+
+# Serialises access to the stage state files, stages run in threads
+_state_lock = threading.Lock()
+
+
+def stage_key(command: str,
+              env: dict[str, str],
+              inputs: list[str]) -> str:
+    """Hash of everything a stage depends on: command, environment and input file contents."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(command.encode())
+    h.update(json.dumps(env, sort_keys=True).encode())
+    for path in sorted(inputs):
+        h.update(file_digest(path).encode())
+    return h.hexdigest()
+
+
+def load_state(path: str) -> dict:
+    with _state_lock:
+        if not os.path.isfile(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+
+def update_state(path: str,
+                 stage: str,
+                 entry: dict) -> None:
+    with _state_lock:
+        state = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                state = json.load(f)
+        state[stage] = entry
+
+        def write(tmp: str) -> None:
+            with open(tmp, "w") as f:
+                json.dump(state, f, indent=1)
+        atomic_write(path, write)
+
+
+def run_stage(stage: str,
+              command: str,
+              cwd: str,
+              env: dict[str, str],
+              inputs: list[str],
+              outputs: Callable[[], list[str]],
+              state_path: str,
+              clean: Callable[[], None] | None = None,
+              post: Callable[[], None] | None = None) -> list[str]:
+    """
+    Run one stage unless its outputs are up to date.
+
+    A stage is skipped if its command, environment and input contents are
+    unchanged since the last run and all outputs recorded then still exist
+    with the same content.
+
+    Args:
+        stage (str): stage name, used in the state file and log file name
+        command (str): shell command
+        cwd (str): working directory
+        env (dict[str, str]): additional environment variables
+        inputs (list[str]): input files
+        outputs (Callable[[], list[str]]): finds the output files after the run
+        state_path (str): state file of the stages
+        clean (Callable | None): removes stale outputs before the run
+        post (Callable | None): moves or renames outputs after the run
+
+    Returns:
+        list[str]: output files
+    """
+    key = stage_key(command, env, inputs)
+    entry = load_state(state_path).get(stage)
+
+    if entry is not None and entry["key"] == key and \
+       all(os.path.isfile(p) and file_digest(p) == h for p, h in entry["outputs"].items()):
+        print(f"{stage}: up to date, skipped.")
+        return list(entry["outputs"])
+
+    if clean is not None:
+        clean()
+
+    os.makedirs(os.path.join(cwd, "output", "logs"), exist_ok=True)
+    log_path = os.path.join(cwd, "output", "logs", f"{stage.replace(':', '_')}.log")
+
+    print(f"{stage}: running {command}")
+    with open(log_path, "w") as log:
+        subprocess.run(command, shell=True, cwd=cwd, env={**os.environ, **env},
+                       stdout=log, stderr=subprocess.STDOUT, check=True)
+
+    if post is not None:
+        post()
+
+    files = outputs()
+    if len(files) == 0:
+        raise RuntimeError(f"{stage} produced no output, see {log_path}")
+
+    update_state(state_path, stage, {"key": key, "outputs": {p: file_digest(p) for p in files}})
+    return files
+
+
+def run_dag(tasks: dict[str, tuple[list[str], Callable[[dict], object]]],
+            workers: int = 1) -> tuple[dict[str, str], dict[str, object]]:
+    """
+    Run tasks as soon as their dependencies are done.
+
+    A failed task is reported and its dependents are blocked, all other
+    tasks still run.
+
+    Args:
+        tasks (dict): task name -> (dependencies, function of the results so far)
+        workers (int): maximum number of tasks running at the same time
+
+    Returns:
+        tuple[dict[str, str], dict[str, object]]: status per task (done, failed, blocked),
+                                                  result per finished task
+    """
+    status = {}
+    results = {}
+    pending = dict(tasks)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+
+        while pending or running:
+
+            for name, (deps, _) in list(pending.items()):
+                if any(status.get(d) in ("failed", "blocked") for d in deps):
+                    status[name] = "blocked"
+                    del pending[name]
+
+            for name, (deps, fn) in list(pending.items()):
+                if all(status.get(d) == "done" for d in deps):
+                    running[pool.submit(fn, results)] = name
+                    del pending[name]
+
+            if not running:
+                # unknown dependencies or a cycle
+                for name in pending:
+                    status[name] = "blocked"
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for f in done:
+                name = running.pop(f)
+                try:
+                    results[name] = f.result()
+                    status[name] = "done"
+                except Exception as e:
+                    status[name] = "failed"
+                    print(f"{name}: failed ({type(e).__name__}: {e})")
+
+    return status, results
+
+
+def move_files(pattern: str,
+               dst_dir: str) -> None:
+    """Move all files matching a pattern into a directory."""
+    os.makedirs(dst_dir, exist_ok=True)
+    for p in glob.glob(pattern):
+        shutil.move(p, os.path.join(dst_dir, os.path.basename(p)))
+
+
+def remove_files(pattern: str) -> None:
+    for p in glob.glob(pattern):
+        os.remove(p)
+
+
+def site_tasks(site: dict,
+               config: dict,
+               fields: dict[str, str]) -> dict[str, tuple[list[str], Callable[[dict], object]]]:
+    """
+    Stages of one site: SCRIP grid -> mapping files -> domain and surface files.
+
+    Args:
+        site (dict): site entry with name, lat and lon
+        config (dict): driver config
+        fields (dict[str, str]): command template fields shared by all sites
+
+    Returns:
+        dict: task name -> (dependencies, function), see run_dag
+    """
+    name = site["name"]
+    cwd = os.path.abspath(os.path.join(config["workdir"], name))
+    state_path = os.path.join(cwd, "stage_state.json")
+    buffer = abs(config.get("latlon_buffer", 0.03))
+    tools = config["tools"]
+
+    for d in ("grids", "maps", "domains", "surf", "logs"):
+        os.makedirs(os.path.join(cwd, "output", d), exist_ok=True)
+
+    gridfile = f"output/grids/SCRIPgrid_1x1_{name}.nc"
+    maps_pattern = os.path.join(cwd, "output", "maps", f"*{name}*.nc")
+    domain_pattern = os.path.join(cwd, "output", "domains", f"domain.*.{name}_{name}.*nc")
+    surf_pattern = os.path.join(cwd, "output", "surf", "surfdata_*.nc")
+
+    site_fields = {**fields, "name": name, "gridfile": gridfile}
+
+    grid_env = {"NX": "1", "NY": "1", "IMASK": "0", "GRIDFILE": gridfile,
+                "S_LAT": str(site["lat"] - buffer), "N_LAT": str(site["lat"] + buffer),
+                "W_LON": str(site["lon"] - buffer), "E_LON": str(site["lon"] + buffer)}
+
+    def grid(results: dict) -> list[str]:
+        path = os.path.join(cwd, gridfile)
+        return run_stage(f"{name}:grid", tools["mkscripgrid"].format(**site_fields), cwd, grid_env,
+                         [], lambda: [path] if os.path.isfile(path) else [], state_path)
+
+    def maps(results: dict) -> list[str]:
+        def outputs() -> list[str]:
+            files = sorted(glob.glob(maps_pattern))
+            if len(files) < config.get("min_maps", 17):
+                raise RuntimeError(f"{name}:maps produced {len(files)} map file(s), "
+                                   f"expected {config.get('min_maps', 17)}")
+            return files
+        return run_stage(f"{name}:maps", tools["mkmapdata"].format(**site_fields), cwd, {},
+                         results[f"{name}:grid"], outputs, state_path,
+                         clean=lambda: remove_files(maps_pattern),
+                         post=lambda: move_files(os.path.join(cwd, "PET*.Log"),
+                                                 os.path.join(cwd, "output", "logs")))
+
+    def avhrr_mapfile(results: dict) -> str:
+        mapfile = [m for m in results[f"{name}:maps"]
+                   if os.path.basename(m).startswith(f"map_0.5x0.5_AVHRR_to_{name}_nomask_aave_da_")]
+        if len(mapfile) == 0:
+            raise FileNotFoundError(f"No AVHRR mapping file for site {name}")
+        return mapfile[-1]
+
+    def domain(results: dict) -> list[str]:
+        mapfile = avhrr_mapfile(results)
+
+        def post() -> None:
+            move_files(os.path.join(cwd, f"domain.lnd.{name}_{name}.*nc"), os.path.join(cwd, "output", "domains"))
+            move_files(os.path.join(cwd, f"domain.ocn.{name}_{name}.*nc"), os.path.join(cwd, "output", "domains"))
+            remove_files(os.path.join(cwd, f"domain.ocn.{name}.*nc"))
+
+        command = tools["gen_domain"].format(**site_fields, mapfile=mapfile)
+        return run_stage(f"{name}:domain", command, cwd, {"MAPFILE": mapfile},
+                         [mapfile] + results["gen_domain"], lambda: sorted(glob.glob(domain_pattern)),
+                         state_path, clean=lambda: remove_files(domain_pattern), post=post)
+
+    def surf(results: dict) -> list[str]:
+        # mksurfdata finds the map files by the date mkmapdata stamped them with
+        match = re.search(r"_c(\d{6})\.nc$", avhrr_mapfile(results))
+        if match is None:
+            raise ValueError(f"No _cYYMMDD date in the AVHRR mapping file name of site {name}")
+        cdate = match.group(1)
+        env = {"CDATE": cdate, "CSMDATA": fields["csmdata"]}
+        return run_stage(f"{name}:surf", tools["mksurfdata"].format(**site_fields, cdate=cdate), cwd, env,
+                         results[f"{name}:maps"], lambda: sorted(glob.glob(surf_pattern)), state_path,
+                         clean=lambda: remove_files(surf_pattern),
+                         post=lambda: move_files(os.path.join(cwd, "surfdata_*"),
+                                                 os.path.join(cwd, "output", "surf")))
+
+    return {f"{name}:grid": ([], grid),
+            f"{name}:maps": ([f"{name}:grid"], maps),
+            f"{name}:domain": ([f"{name}:maps", "gen_domain"], domain),
+            f"{name}:surf": ([f"{name}:maps"], surf)}
+
+
+def build_tasks(config: dict) -> dict[str, tuple[list[str], Callable[[dict], object]]]:
+    """
+    Task graph of all sites, with one shared gen_domain compilation.
+
+    Args:
+        config (dict): driver config
+
+    Returns:
+        dict: task name -> (dependencies, function), see run_dag
+    """
+    workdir = os.path.abspath(config["workdir"])
+    os.makedirs(workdir, exist_ok=True)
+
+    fields = {"static_repo": os.path.abspath(config["static_repo"]),
+              "griddir": config["griddir"],
+              "csmdata": config["csmdata"],
+              "gen_domain": os.path.join(workdir, "bin", "gen_domain")}
+
+    source = config["gen_domain_source"].format(**fields)
+
+    def compile_gen_domain(results: dict) -> list[str]:
+        os.makedirs(os.path.dirname(fields["gen_domain"]), exist_ok=True)
+        return run_stage("gen_domain", config["tools"]["compile_gen_domain"].format(**fields), workdir, {},
+                         [source], lambda: [fields["gen_domain"]] if os.path.isfile(fields["gen_domain"]) else [],
+                         os.path.join(workdir, "stage_state.json"))
+
+    tasks = {"gen_domain": ([], compile_gen_domain)}
+    for site in config["sites"]:
+        tasks.update(site_tasks(site, config, fields))
+    return tasks
+
+
+if __name__ == "__main__":
+
+    config = yaml.safe_load(open(config_file))
+
+    if not isinstance(config, dict):
+        raise ValueError("Configuration file is empty or not found.")
+
+    status, _ = run_dag(build_tasks(config), workers=config.get("workers", 1))
+
+    for name, s in status.items():
+        print(f"{name}: {s}")
+
+    n_failed = sum(s != "done" for s in status.values())
+    if n_failed:
+        raise SystemExit(f"{n_failed} stage(s) failed or blocked.")